@@ -2,8 +2,12 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 
-# 读取数据
-df = pd.read_csv("framework_logic_results.csv")
+# 读取数据 (只读绘图用到的三列，并指定类型跳过类型推断)
+df = pd.read_csv(
+    "framework_logic_results.csv",
+    usecols=['Scenario', 'RTT(ms)', 'Strategy'],
+    dtype={'Scenario': 'string', 'Strategy': 'category', 'RTT(ms)': 'float32'}
+)
 
 # 设置风格
 sns.set_theme(style="whitegrid")
@@ -11,7 +15,7 @@ plt.figure(figsize=(10, 6))
 
 # === 绘制图表：网络延迟对策略的影响 ===
 # 筛选出只有网络变化的场景 (Scenario 1-4)
-net_df = df[df['Scenario'].str.contains('网络|断网')]
+mask = df['Scenario'].str.contains('网络|断网').to_numpy(dtype=bool, na_value=False)
 
 # 为了画图，我们将策略映射为数字
 strategy_map = {
@@ -19,9 +23,12 @@ strategy_map = {
     'adaptive_confidence': 1,  # 混合
     'edge_only': 2             # 本地独立
 }
-net_df['Strategy_Num'] = net_df['Strategy'].map(strategy_map)
+# 直接取 NumPy 数组，不在切片上赋值新列 (避免 SettingWithCopyWarning 和整表拷贝)
+rtt = df.loc[mask, 'RTT(ms)'].to_numpy()
+strategy_num = df.loc[mask, 'Strategy'].map(strategy_map).to_numpy()
 
-plt.plot(net_df['RTT(ms)'], net_df['Strategy_Num'], marker='o', linestyle='--', linewidth=2, color='b')
+# 仅数据点栅格化，坐标轴和文字保持矢量
+plt.plot(rtt, strategy_num, marker='o', linestyle='--', linewidth=2, color='b', rasterized=True)
 
 # 美化图表
 plt.yticks([0, 1, 2], ['Standard\n(Cloud Heavy)', 'Adaptive\n(Hybrid)', 'Edge Only\n(Offline)'])
@@ -32,11 +39,12 @@ plt.title('Framework Decision Boundary Analysis', fontsize=14)
 plt.grid(True, which="both", ls="-", alpha=0.2)
 
 # 标注区域
-plt.axvspan(10, 100, color='green', alpha=0.1, label='Strong Net Zone')
-plt.axvspan(100, 1000, color='yellow', alpha=0.1, label='Weak Net Zone')
-plt.axvspan(1000, 3000, color='red', alpha=0.1, label='Broken Net Zone')
+plt.axvspan(10, 100, color='green', alpha=0.1, label='Strong Net Zone', rasterized=True)
+plt.axvspan(100, 1000, color='yellow', alpha=0.1, label='Weak Net Zone', rasterized=True)
+plt.axvspan(1000, 3000, color='red', alpha=0.1, label='Broken Net Zone', rasterized=True)
 plt.legend()
 
 plt.tight_layout()
 plt.savefig("decision_boundary.png")
-print("🖼️ 图表已保存为 decision_boundary.png")
\ No newline at end of file
+plt.savefig("decision_boundary.pdf", dpi=200)  # 论文用矢量版
+print("🖼️ 图表已保存为 decision_boundary.png / decision_boundary.pdf")
\ No newline at end of file
@@ -1,4 +1,10 @@
+import argparse
+import asyncio
+import os
+import sys
+import aiohttp
 import requests
+from requests.adapters import HTTPAdapter
 import time
 import pandas as pd
 import numpy as np
@@ -39,10 +45,25 @@ SCENARIO_PART_2 = [
     ("+F4 (Weak Net)",    {"use_confidence_check": True})
 ]
 
+# 复用同一个 keep-alive 连接，避免每次请求重新握手污染延迟测量
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+SESSION.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+
+# 非交互运行 (nohup/CI) 时，通过创建该文件通知脚本弱网已就绪
+WEAKNET_SENTINEL = "/tmp/cecof_weaknet_ready"
+
+# 汇总时参与平均的指标列
+METRIC_COLS = ['Latency', 'TTFT', 'TPS', 'AR']
+
 # ===========================================
 
-def run_single_inference(task_conf, scenario_name, scenario_params):
-    """运行单次推理，返回指标"""
+def count_tokens(text):
+    """按空格数粗略估算 token 数 (C 层计数，不构造分词列表)"""
+    return text.count(' ') + 1 if text else 0
+
+def build_payload(task_conf, scenario_params):
+    """构造单次推理的请求体"""
     # 基础参数
     payload = {
         "prompt": task_conf["prompt"],
@@ -77,47 +98,87 @@ def run_single_inference(task_conf, scenario_name, scenario_params):
         payload["max_tokens"] = 10 
         payload["use_draft_verify"] = False 
 
+    return payload
+
+def build_metrics(task_conf, scenario_name, data, total_lat):
+    """根据响应数据和总延迟计算指标"""
+    edge_lat = data.get('edge_latency_ms', 0)
+    
+    # 计算指标
+    # 1. TTFT
+    if "Baseline" in scenario_name:
+        ttft = total_lat # 云端模式，首字即总时
+    else:
+        ttft = edge_lat
+        if ttft == 0: ttft = total_lat # 防止异常
+
+    # 2. Token Count & TPS
+    text = data.get('text', '')
+    tokens = count_tokens(text)
+    if tokens == 0: tokens = 1
+    tps = tokens / (total_lat / 1000)
+    
+    # 3. Acceptance Rate
+    ar = data.get('acceptance_rate', 0) * 100
+    
+    return {
+        "Scenario": scenario_name,
+        "Task": task_conf["name"],
+        "Latency": total_lat,
+        "TTFT": ttft,
+        "TPS": tps,
+        "AR": ar
+    }
+
+def run_single_inference(task_conf, scenario_name, scenario_params):
+    """运行单次推理，返回指标 (顺序模式)"""
+    payload = build_payload(task_conf, scenario_params)
+
     try:
-        start = time.time()
+        start = time.perf_counter()
         # 超时时间设长一点，给 Cloud 机会
-        resp = requests.post(EDGE_URL, json=payload, timeout=90)
-        end = time.time()
+        resp = SESSION.post(EDGE_URL, json=payload, timeout=90)
+        end = time.perf_counter()
         
         if resp.status_code == 200:
-            data = resp.json()
-            total_lat = (end - start) * 1000
-            edge_lat = data.get('edge_latency_ms', 0)
-            
-            # 计算指标
-            # 1. TTFT
-            if "Baseline" in scenario_name:
-                ttft = total_lat # 云端模式，首字即总时
-            else:
-                ttft = edge_lat
-                if ttft == 0: ttft = total_lat # 防止异常
-
-            # 2. Token Count & TPS
-            text = data.get('text', '')
-            tokens = len(text.split())
-            if tokens == 0: tokens = 1
-            tps = tokens / (total_lat / 1000)
-            
-            # 3. Acceptance Rate
-            ar = data.get('acceptance_rate', 0) * 100
-            
-            return {
-                "Scenario": scenario_name,
-                "Task": task_conf["name"],
-                "Latency": total_lat,
-                "TTFT": ttft,
-                "TPS": tps,
-                "AR": ar
-            }
+            return build_metrics(task_conf, scenario_name, resp.json(), (end - start) * 1000)
         return None
     except Exception as e:
         print(f"❌ Error: {e}")
         return None
 
+async def run_single_inference_async(session, task_conf, scenario_name, scenario_params):
+    """运行单次推理，返回指标 (并发模式)"""
+    payload = build_payload(task_conf, scenario_params)
+
+    try:
+        start = time.perf_counter()
+        async with session.post(EDGE_URL, json=payload) as resp:
+            if resp.status != 200:
+                return None
+            data = await resp.json()
+        end = time.perf_counter()
+        return build_metrics(task_conf, scenario_name, data, (end - start) * 1000)
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        return None
+
+def wait_for_weaknet(sentinel, timeout):
+    """等待弱网环境就绪：交互终端按回车，否则轮询哨兵文件直到出现或超时"""
+    if sys.stdin.isatty():
+        input("👉 准备好后，按 [Enter] 键继续运行 F4 测试...")
+        return
+    
+    print(f"👉 非交互模式: 等待哨兵文件 {sentinel} (最长 {timeout:.0f}s)...")
+    t0 = time.time()
+    while not os.path.exists(sentinel) and time.time() - t0 < timeout:
+        time.sleep(1)
+    
+    if os.path.exists(sentinel):
+        print("✅ 检测到哨兵文件，继续运行 F4 测试")
+    else:
+        print("⚠️ 等待超时，直接继续运行 F4 测试")
+
 def run_group(scenarios, all_results):
     """运行一组场景"""
     for sc_name, sc_params in scenarios:
@@ -125,38 +186,63 @@ def run_group(scenarios, all_results):
         
         for task in TASKS:
             print(f"   👉 任务: {task['name']} ", end="")
-            task_metrics = []
             
             for i in range(ROUNDS):
                 m = run_single_inference(task, sc_name, sc_params)
                 if m:
-                    task_metrics.append(m)
+                    # 原始单次结果直接入列，平均值在 main 中统一 groupby 计算
+                    all_results.append(m)
                     print(".", end="", flush=True)
                 else:
                     print("x", end="", flush=True)
-            
-            # 计算该任务在该场景下的平均值
-            if task_metrics:
-                df_tmp = pd.DataFrame(task_metrics)
-                avg_m = df_tmp.mean(numeric_only=True)
-                all_results.append({
-                    "Scenario": sc_name,
-                    "Task": task["name"],
-                    "Latency": avg_m["Latency"],
-                    "TTFT": avg_m["TTFT"],
-                    "TPS": avg_m["TPS"],
-                    "AR": avg_m["AR"]
-                })
             print(" 完成")
 
+async def run_group_async(scenarios, all_results):
+    """并发运行一组场景：同一场景下所有 (任务, 轮次) 同时发出"""
+    connector = aiohttp.TCPConnector(limit=8, keepalive_timeout=60)
+    timeout = aiohttp.ClientTimeout(total=90)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        for sc_name, sc_params in scenarios:
+            print(f"\n🧪 [场景]: {sc_name}")
+            
+            results = await asyncio.gather(*[
+                run_single_inference_async(session, task, sc_name, sc_params)
+                for task in TASKS for _ in range(ROUNDS)
+            ])
+            
+            for i, task in enumerate(TASKS):
+                print(f"   👉 任务: {task['name']} ", end="")
+                for m in results[i * ROUNDS:(i + 1) * ROUNDS]:
+                    if m:
+                        all_results.append(m)
+                        print(".", end="")
+                    else:
+                        print("x", end="")
+                print(" 完成")
+
 def main():
+    parser = argparse.ArgumentParser(description="多任务全流程消融实验")
+    parser.add_argument("--sequential", action="store_true",
+                        help="逐个顺序发送请求 (纯延迟测量，避免并发互相干扰)")
+    parser.add_argument("--sentinel", default=WEAKNET_SENTINEL,
+                        help="非交互模式下表示弱网已就绪的哨兵文件路径")
+    parser.add_argument("--sentinel-timeout", type=float, default=1800,
+                        help="等待哨兵文件的最长秒数，超时后直接继续")
+    args = parser.parse_args()
+    
+    def run(scenarios, results):
+        if args.sequential:
+            run_group(scenarios, results)
+        else:
+            asyncio.run(run_group_async(scenarios, results))
+    
     all_results = []
     
     print("🚀 开始多任务全流程消融实验")
     print("="*60)
     
     # 1. 跑前 4 组 (不需要人工干预)
-    run_group(SCENARIOS_PART_1, all_results)
+    run(SCENARIOS_PART_1, all_results)
     
     # 2. 暂停，等待人工开启弱网
     print("\n" + "="*60)
@@ -164,35 +250,40 @@ def main():
     print("   建议: 运行 'python proxy_delay.py' (监听9000端口)")
     print("   或者: 在 WSL2 运行 'sudo tc qdisc replace dev eth0 root netem delay 500ms'")
     print("   (记得修改 config.yaml 的端口并重启 Edge Server)")
+    print(f"   非交互运行时: 准备好后执行 'touch {args.sentinel}'")
     print("="*60)
-    input("👉 准备好后，按 [Enter] 键继续运行 F4 测试...")
+    wait_for_weaknet(args.sentinel, args.sentinel_timeout)
     
     # 3. 跑最后 1 组 (F4)
-    run_group(SCENARIO_PART_2, all_results)
+    run(SCENARIO_PART_2, all_results)
     
     # ================= 结果展示 =================
     df = pd.DataFrame(all_results)
     
+    # 场景列一开始就设为有序类别 (按执行顺序)，后续 groupby 直接沿用该顺序
+    scenario_order = [s[0] for s in SCENARIOS_PART_1] + [s[0] for s in SCENARIO_PART_2]
+    df['Scenario'] = pd.Categorical(df['Scenario'], categories=scenario_order, ordered=True)
+    
+    # 一次性按 (场景, 任务) 求各轮平均值
+    df = df.groupby(
+        ['Scenario', 'Task'], as_index=False, sort=False, observed=True
+    )[METRIC_COLS].mean()
+    
     # 格式化数字
     pd.options.display.float_format = '{:.1f}'.format
     
     print("\n📊 [详细报告] 各任务表现")
     print("="*80)
-    # 按任务分组显示
-    for task_name in [t['name'] for t in TASKS]:
+    # 按任务分组显示 (一次 groupby 代替逐任务布尔筛选，类别顺序与 TASKS 一致)
+    df['Task'] = pd.Categorical(df['Task'], categories=[t['name'] for t in TASKS], ordered=True)
+    for task_name, task_df in df.groupby('Task', observed=True):
         print(f"\n--- Task: {task_name} ---")
-        task_df = df[df['Task'] == task_name][['Scenario', 'Latency', 'TTFT', 'TPS', 'AR']]
-        print(task_df.to_string(index=False))
+        print(task_df[['Scenario'] + METRIC_COLS].to_string(index=False))
 
     print("\n📊 [汇总报告] 全局平均 (System Average)")
     print("="*80)
-    # 按场景分组算平均
-    summary = df.groupby('Scenario')[['Latency', 'TTFT', 'TPS', 'AR']].mean().reset_index()
-    
-    # 调整顺序 (让表格按我们执行的顺序排)
-    scenario_order = [s[0] for s in SCENARIOS_PART_1] + [s[0] for s in SCENARIO_PART_2]
-    summary['Scenario'] = pd.Categorical(summary['Scenario'], categories=scenario_order, ordered=True)
-    summary = summary.sort_values('Scenario')
+    # 按场景分组算平均 (类别有序，sort=True 即为执行顺序)
+    summary = df.groupby('Scenario', observed=True, sort=True)[METRIC_COLS].mean().reset_index()
     
     print(summary.to_string(index=False))
     print("="*80)
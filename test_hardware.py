@@ -1,4 +1,5 @@
 import os
+import functools
 from vllm import LLM, SamplingParams
 from llama_cpp import Llama
 
@@ -8,6 +9,21 @@ CLOUD_MODEL_PATH = "models/cloud/TinyLlama-1.1B-Chat-v1.0"
 EDGE_MODEL_PATH = "models/edge/tinyllama-1.1b-chat-v1.0.Q4_K_M.gguf"
 # ===========================================
 
+@functools.lru_cache(maxsize=1)
+def get_edge_llm():
+    """加载并缓存 Edge 模型：首次调用付出加载成本，之后直接复用同一实例"""
+    return Llama(
+        model_path=EDGE_MODEL_PATH,
+        n_ctx=512,
+        n_gpu_layers=-1, # 尝试让所有层都上 GPU
+        n_batch=512,
+        n_threads=os.cpu_count(),
+        use_mmap=True,   # 权重按需映射
+        use_mlock=True,  # 锁定在内存中，避免被换出后重新读盘
+        logits_all=False,
+        verbose=False
+    )
+
 def test_edge_cpp():
     print("\n" + "="*20 + " 正在测试 Edge (Llama.cpp) " + "="*20)
     if not os.path.exists(EDGE_MODEL_PATH):
@@ -16,12 +32,7 @@ def test_edge_cpp():
 
     try:
         # 测试加载 GGUF (尝试使用 GPU 加速)
-        llm_edge = Llama(
-            model_path=EDGE_MODEL_PATH,
-            n_ctx=512,
-            n_gpu_layers=-1, # 尝试让所有层都上 GPU
-            verbose=False
-        )
+        llm_edge = get_edge_llm()
         output = llm_edge("Q: What is the capital of France? A: ", max_tokens=32)
         print(f"✅ Edge 推理成功: {output['choices'][0]['text']}")
         print("🎉 Llama.cpp Edge 端测试通过！")
@@ -29,36 +40,51 @@ def test_edge_cpp():
     except Exception as e:
         print(f"❌ Llama.cpp 启动失败: {e}")
 
-def test_cloud_vllm():
-    print("\n" + "="*20 + " 正在测试 Cloud (vLLM 4卡并行) " + "="*20)
+def test_cloud_vllm(prompts=None, tp=1, enable_prefix_caching=True):
+    """
+    prompts: 待生成的 prompt 列表，一次性交给 llm.generate 以利用连续批处理
+    tp: 张量并行卡数。单条 prompt 的冒烟测试用 1 卡即可，
+        多卡 allreduce 只有在批量足够大时才划算 (见 __main__ 中的 --tp)
+    """
+    if not prompts:
+        prompts = ["Hello, I am a"]
+
+    print("\n" + "="*20 + f" 正在测试 Cloud (vLLM {tp}卡并行) " + "="*20)
     if not os.path.exists(CLOUD_MODEL_PATH):
         print(f"❌ 错误: 找不到路径 {CLOUD_MODEL_PATH}")
         return
 
     try:
-        # 核心测试：4卡 V100 并行加载
+        # 核心测试：V100 加载 (卡数由 tp 决定)
         llm = LLM(
             model=CLOUD_MODEL_PATH,
-            tensor_parallel_size=4,  # <--- 强制调用 4 张显卡
+            tensor_parallel_size=tp,
             dtype="float16",         # <--- V100 必须项
             trust_remote_code=True,
-            gpu_memory_utilization=0.6 # 小模型显存给少点，防止和 Edge 抢资源
+            gpu_memory_utilization=0.6, # 小模型显存给少点，防止和 Edge 抢资源
+            enable_prefix_caching=enable_prefix_caching  # 后续相同前缀的 prompt 复用 KV
         )
         
-        prompts = ["Hello, I am a"]
         sampling_params = SamplingParams(temperature=0.7, top_p=0.95, max_tokens=20)
+        # 所有 prompt 一次提交，由 vLLM 调度器统一打包 prefill/decode
         outputs = llm.generate(prompts, sampling_params)
 
         for output in outputs:
             generated_text = output.outputs[0].text
             print(f"✅ vLLM 生成结果: {output.prompt!r} -> {generated_text!r}")
-        print("🎉 vLLM Cloud 端测试通过！4张显卡火力全开！")
+        print(f"🎉 vLLM Cloud 端测试通过！({tp} 张显卡)")
         
     except Exception as e:
         print(f"❌ vLLM 启动失败: {e}")
 
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Edge/Cloud 硬件冒烟测试")
+    parser.add_argument("--tp", type=int, default=1, help="vLLM 张量并行卡数 (大批量基准测试时再用 4)")
+    parser.add_argument("--prompts", nargs="+", default=None, help="批量测试用的 prompt 列表")
+    args = parser.parse_args()
+
     # 1. 先测 Edge (通常比较快)
     test_edge_cpp()
     # 2. 再测 Cloud (vLLM 初始化比较慢)
-    test_cloud_vllm()
\ No newline at end of file
+    test_cloud_vllm(prompts=args.prompts, tp=args.tp)
\ No newline at end of file
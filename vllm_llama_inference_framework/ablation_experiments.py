@@ -4,13 +4,33 @@
 用于评估各个模块对整体性能的影响
 """
 import asyncio
+import copy
+import functools
 import json
+import os
 import time
 from typing import Dict, Any, List, Optional
+import numpy as np
 import yaml
 
+# orjson 可选: 存在时用原生实现序列化报告，否则回退到标准库 json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# 优先使用 libyaml 的 C 实现解析配置，未编译 libyaml 时回退到纯 Python 版本
+_YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
 from common.types import InferenceRequest
-from common.http_client import EdgeCloudHTTPClient, SimpleHTTPClient
+from common.http_client import EdgeCloudHTTPClient, HTTPClient
+
+
+@functools.lru_cache(maxsize=8)
+def _load_config_cached(config_path: str, mtime: float) -> Dict[str, Any]:
+    """解析 YAML 配置；mtime 只作为缓存键的一部分"""
+    with open(config_path, 'r', encoding='utf-8') as f:
+        return yaml.load(f, Loader=_YAML_LOADER) or {}
 
 
 class AblationExperiment:
@@ -19,15 +39,20 @@ class AblationExperiment:
     def __init__(self, config_path: str = "config/config.yaml"):
         self.config = self._load_config(config_path)
         self.results: List[Dict[str, Any]] = []
+        
+        # 所有实验共享的 HTTP 客户端 (首次使用时创建，复用连接池)
+        self._client: Optional[HTTPClient] = None
     
     def _load_config(self, config_path: str) -> Dict[str, Any]:
-        """加载配置"""
+        """加载配置 (按 路径+修改时间 缓存，文件改动后自动重新解析)"""
         try:
-            with open(config_path, 'r', encoding='utf-8') as f:
-                return yaml.safe_load(f)
+            mtime = os.path.getmtime(config_path)
         except FileNotFoundError:
             print(f"[Ablation] 配置文件不存在，使用默认配置")
             return {}
+        
+        # 缓存中的字典是共享的，返回副本避免调用方修改污染缓存
+        return copy.deepcopy(_load_config_cached(config_path, mtime))
     
     async def run_single_experiment(
         self,
@@ -53,7 +78,7 @@ class AblationExperiment:
         
         # 应用配置覆盖
         experiment_config = self._apply_config_overrides(
-            self.config.copy(), 
+            self.config, 
             config_overrides
         )
         
@@ -85,17 +110,46 @@ class AblationExperiment:
         base_config: Dict[str, Any], 
         overrides: Dict[str, Any]
     ) -> Dict[str, Any]:
-        """应用配置覆盖"""
+        """
+        应用配置覆盖
+        
+        对 base_config 深拷贝一次后按点分路径逐个写入叶子节点，
+        不会修改 base_config 本身。
+        
+        Args:
+            base_config: 基础配置
+            overrides: 配置覆盖 (嵌套字典或点分路径字典均可)
+            
+        Returns:
+            覆盖后的新配置
+        """
+        config = copy.deepcopy(base_config)
+        
+        for dotted_key, value in self._flatten_overrides(overrides).items():
+            *parents, leaf = dotted_key.split('.')
+            node = config
+            for part in parents:
+                child = node.get(part)
+                if not isinstance(child, dict):
+                    child = node[part] = {}
+                node = child
+            node[leaf] = value
+        
+        return config
+    
+    @staticmethod
+    def _flatten_overrides(
+        overrides: Dict[str, Any], 
+        prefix: str = ""
+    ) -> Dict[str, Any]:
+        """将嵌套的配置覆盖展开为 {'a.b.c': value} 形式"""
+        flat = {}
         for key, value in overrides.items():
-            if isinstance(value, dict) and key in base_config:
-                base_config[key] = self._apply_config_overrides(
-                    base_config[key], 
-                    value
-                )
+            if isinstance(value, dict):
+                flat.update(AblationExperiment._flatten_overrides(value, f"{prefix}{key}."))
             else:
-                base_config[key] = value
-        
-        return base_config
+                flat[f"{prefix}{key}"] = value
+        return flat
     
     def _print_config_changes(self, overrides: Dict[str, Any]):
         """打印配置变更"""
@@ -108,6 +162,20 @@ class AblationExperiment:
         
         print_changes(overrides)
     
+    async def _get_client(self, endpoint: str) -> HTTPClient:
+        """获取共享客户端 (端点变化时重建)"""
+        if self._client is None or self._client.base_url != endpoint.rstrip('/'):
+            await self.aclose()
+            self._client = HTTPClient(endpoint)
+            await self._client.start()
+        return self._client
+    
+    async def aclose(self):
+        """关闭共享客户端"""
+        if self._client is not None:
+            await self._client.stop()
+            self._client = None
+    
     async def _run_inference_tests(
         self,
         config: Dict[str, Any],
@@ -120,13 +188,13 @@ class AblationExperiment:
         # 创建客户端
         edge_endpoint = config['communication']['edge_endpoint']
         
-        # 注意: 这里使用模拟客户端，实际应该使用 EdgeCloudHTTPClient
-        client = SimpleHTTPClient(edge_endpoint)
+        # 复用同一个客户端，避免每个实验重新建立连接
+        client = await self._get_client(edge_endpoint)
         
         for i, prompt in enumerate(prompts):
             print(f"\n  测试 {i+1}/{len(prompts)}: {prompt[:50]}...")
             
-            start_time = time.time()
+            start_time = time.perf_counter()
             
             try:
                 # 从配置中提取参数
@@ -145,19 +213,21 @@ class AblationExperiment:
                 # 发送请求
                 response = await client.send_request('POST', '/inference', request_data)
                 
-                end_time = time.time()
+                end_time = time.perf_counter()
                 
-                # 记录结果
+                # 记录结果 (只保留报告需要的字段，不保留完整生成文本)
+                text = response.get('text', '')
                 result = {
                     'prompt': prompt,
-                    'response': response,
+                    'text_len': len(text),
+                    'edge_latency_ms': response.get('edge_latency_ms'),
                     'latency_ms': (end_time - start_time) * 1000,
                     'success': 'error' not in response
                 }
                 
                 if result['success']:
                     print(f"  ✅ 成功 - 延迟: {result['latency_ms']:.2f}ms")
-                    print(f"  结果: {response.get('text', 'N/A')[:100]}...")
+                    print(f"  结果: {text[:100] if text else 'N/A'}...")
                 else:
                     print(f"  ❌ 失败 - 错误: {response.get('error', 'Unknown')}")
                 
@@ -281,27 +351,22 @@ class AblationExperiment:
                 baseline_result = result
                 break
         
-        if baseline_result:
-            baseline_latencies = [
-                r['latency_ms'] for r in baseline_result['results'] 
-                if r['success']
-            ]
+        baseline_latencies = self._success_latencies(baseline_result) if baseline_result else None
+        
+        if baseline_latencies is not None:
             summary['baseline_latency'] = {
-                'mean': sum(baseline_latencies) / len(baseline_latencies) if baseline_latencies else 0,
-                'min': min(baseline_latencies) if baseline_latencies else 0,
-                'max': max(baseline_latencies) if baseline_latencies else 0
+                'mean': float(baseline_latencies.mean()) if baseline_latencies.size else 0,
+                'min': float(baseline_latencies.min()) if baseline_latencies.size else 0,
+                'max': float(baseline_latencies.max()) if baseline_latencies.size else 0
             }
         
         # 与基准比较
         for result in self.results:
             if result['name'] != 'baseline':
-                latencies = [
-                    r['latency_ms'] for r in result['results'] 
-                    if r['success']
-                ]
+                latencies = self._success_latencies(result)
                 
-                if latencies and baseline_latencies:
-                    mean_latency = sum(latencies) / len(latencies)
+                if latencies.size and baseline_latencies is not None and baseline_latencies.size:
+                    mean_latency = float(latencies.mean())
                     baseline_mean = summary['baseline_latency']['mean']
                     
                     comparison = {
@@ -320,12 +385,27 @@ class AblationExperiment:
             'generated_at': time.time()
         }
     
+    @staticmethod
+    def _success_latencies(result: Dict[str, Any]) -> np.ndarray:
+        """提取实验中成功请求的延迟数组"""
+        return np.fromiter(
+            (r['latency_ms'] for r in result['results'] if r['success']),
+            dtype=np.float64
+        )
+    
     def save_report(self, filepath: str = "ablation_report.json"):
         """保存实验报告"""
         report = self.generate_report()
         
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(report, f, indent=2, ensure_ascii=False)
+        if orjson is not None:
+            with open(filepath, 'wb') as f:
+                f.write(orjson.dumps(
+                    report,
+                    option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+                ))
+        else:
+            with open(filepath, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
         
         print(f"\n[Ablation] 实验报告已保存到: {filepath}")
 
@@ -355,13 +435,16 @@ async def main():
     
     print(f"测试提示数量: {len(test_prompts)}")
     
-    # 运行基准实验
-    print("\n1. 运行基准实验...")
-    await experiment.run_baseline_experiment(test_prompts)
-    
-    # 运行消融实验
-    print("\n2. 运行消融实验...")
-    await experiment.run_all_ablation_experiments(test_prompts)
+    try:
+        # 运行基准实验
+        print("\n1. 运行基准实验...")
+        await experiment.run_baseline_experiment(test_prompts)
+        
+        # 运行消融实验
+        print("\n2. 运行消融实验...")
+        await experiment.run_all_ablation_experiments(test_prompts)
+    finally:
+        await experiment.aclose()
     
     # 生成并保存报告
     print("\n3. 生成实验报告...")
@@ -3,11 +3,19 @@
 """
 import asyncio
 import json
+import logging
 import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any, Optional, List
 import aiohttp
 from aiohttp import web
 
+# uvloop 可选: 存在时使用基于 libuv 的事件循环，否则使用标准 asyncio 循环
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
 # ==================== 1. 引入 vLLM 组件 ====================
 try:
     from vllm import SamplingParams
@@ -22,20 +30,28 @@ from common.types import (
     MessageType,
     InferenceRequest
 )
-from cloud.draft_verifier import DraftVerifier
+from common.codec import dumps, json_response, read_json
+from common.queue_logging import setup_queue_logging, shutdown_queue_logging
+from cloud.draft_verifier import DraftVerifier, cached_sampling_params
 from cloud.kv_cache import VLLMKVCache
 
 
+# 云端日志: 经 common.queue_logging 的后台队列输出 (CloudServer 构造时初始化)
+logger = logging.getLogger('cloud')
+
+
 class CloudServer:
     """云端服务器"""
     
     def __init__(self, config: Dict[str, Any]):
         self.config = config
+        setup_queue_logging(logger, config.get('log_level', 'INFO'))
         
-        # 初始化 KV Cache 管理器 (如果需要)
+        # 初始化 KV Cache 管理器 (仅用于统计/消融，vLLM 不读取这里的块表)
         self.kv_cache = VLLMKVCache(
             max_blocks=config.get('kv_cache_blocks', 10000),
-            enable_prefix_caching=config.get('enable_prefix_caching', True)
+            enable_prefix_caching=config.get('enable_prefix_caching', True),
+            eviction_policy=config.get('kv_eviction_policy', 'lru')
         )
         
         # ==================== 模型路径解析逻辑 ====================
@@ -54,23 +70,59 @@ class CloudServer:
 
         print(f"[CloudServer] 最终读取的模型路径: {target_path}")
 
+        # vLLM 专用线程池 (仅同步 LLM 引擎使用): generate 是同步阻塞的，与 aiohttp 默认 executor 隔离；
+        # 默认 1 个 worker，并行度交给 vLLM 自身的连续批处理调度
+        self._vllm_executor = ThreadPoolExecutor(
+            max_workers=config.get('vllm_workers', 1),
+            thread_name_prefix='vllm'
+        )
+
         # 初始化验证器 (它持有 vLLM 引擎实例)
         self.draft_verifier = DraftVerifier(
             model_path=target_path,
-            acceptance_threshold=config.get('acceptance_threshold', 0.8)
+            acceptance_threshold=config.get('acceptance_threshold', 0.8),
+            enable_prefix_caching=config.get('enable_prefix_caching', True),
+            speculative_model=config.get('speculative_model'),
+            num_speculative_tokens=config.get('num_speculative_tokens', 5),
+            max_batch_size=config.get('max_batch_size', 32),
+            # 微批收集窗口 (max_batch_wait_ms，兼容旧键 batch_timeout_ms)
+            batch_timeout_ms=config.get('max_batch_wait_ms', config.get('batch_timeout_ms', 5.0)),
+            executor=self._vllm_executor,
+            # KV 块的实际复用由 vLLM prefix caching 完成；Python 侧的 token 前缀记录
+            # 只用于统计，默认不在推理热路径上执行
+            kv_cache=self.kv_cache if config.get('track_prefix_stats', False) else None,
+            use_async_engine=config.get('use_async_engine', True),
+            strict_verify=config.get('strict_verify', True)
         )
         
-        # 统计信息
+        # 出站 HTTP 会话 (在 start 中创建)
+        self.session: Optional[aiohttp.ClientSession] = None
+        
+        # 统计信息 (只累加原始和，平均值在查询时计算)
         self.stats = {
             'total_requests': 0,
             'total_verifications': 0,
-            'avg_acceptance_rate': 0.0,
-            'avg_latency_ms': 0.0
+            'sum_acceptance_rate': 0.0,
+            'sum_latency_ms': 0.0
         }
     
     async def start(self):
         """启动云端服务器"""
         print(f"[Cloud] 云端服务器启动，配置: {self.config}")
+        
+        # 对外调用 (回退到其他云端、上报等) 共享的会话，复用 TCP/TLS 连接
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=128, ttl_dns_cache=300, keepalive_timeout=30)
+            )
+    
+    async def stop(self):
+        """释放出站会话与 vLLM 线程池"""
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+        self._vllm_executor.shutdown(wait=False)
+        shutdown_queue_logging(logger)
     
     async def handle_verify_request(
         self, 
@@ -83,7 +135,7 @@ class CloudServer:
             # 解析请求
             verify_request = VerifyRequest(**request_data.get('data', {}))
             
-            # print(f"[Cloud] 收到验证请求: len={len(verify_request.draft_tokens)}")
+            logger.debug('收到验证请求: len=%d', len(verify_request.draft_tokens))
             
             # 调用验证器
             verify_response = await self.draft_verifier.verify_draft(verify_request)
@@ -91,17 +143,35 @@ class CloudServer:
             # 更新统计
             self._update_stats(verify_response)
             
-            # print(f"[Cloud] 验证完成: AR={verify_response.acceptance_rate:.2%}")
+            logger.debug('验证完成: AR=%.2f', verify_response.acceptance_rate)
             
             return {
                 'type': MessageType.VERIFY_RESPONSE.value,
-                'data': verify_response.__dict__
+                'data': verify_response
             }
             
         except Exception as e:
-            print(f"[Cloud] 验证错误: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception('验证错误: %s', e)
+            return {'type': 'error', 'message': str(e)}
+    
+    async def handle_prefetch_request(
+        self,
+        request_data: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """
+        预取标准答案: 边端开始起草时调用，云端立即开始生成，
+        随后到达的同一 prompt 的验证请求直接复用结果 (不等待生成完成即返回)
+        """
+        try:
+            data = request_data.get('data', {})
+            self.draft_verifier.prefetch_ground_truth(
+                data['prompt'],
+                int(data.get('max_tokens', 0)),
+                prompt_token_ids=data.get('prompt_token_ids')
+            )
+            return {'type': MessageType.PREFETCH_REQUEST.value, 'status': 'accepted'}
+        except Exception as e:
+            logger.exception('预取错误: %s', e)
             return {'type': 'error', 'message': str(e)}
     
     # ==================== 2. 核心修改：真实直接推理 ====================
@@ -113,51 +183,39 @@ class CloudServer:
         直接推理 (CLOUD_DIRECT 模式)
         当 Edge 决定完全卸载任务时调用此接口，使用 vLLM 直接生成。
         """
-        start_time = time.time()
+        start_time = time.perf_counter()
         try:
             # 解析请求
             req_data = request_data.get('data', {})
             inference_request = InferenceRequest(**req_data)
             
-            print(f"☁️ [Cloud] 直接推理请求: Prompt='{inference_request.prompt[:30]}...'")
+            logger.debug("直接推理请求: Prompt='%.30s...'", inference_request.prompt)
             
-            # 构造 vLLM 采样参数
+            # 构造 vLLM 采样参数 (相同参数组合复用同一个对象)
             # 注意: 如果你的 InferenceRequest 里没有 top_k 等字段，这里可以写死或去 types.py 加
-            sampling_params = SamplingParams(
-                temperature=inference_request.temperature,
-                max_tokens=inference_request.max_tokens,
-                top_p=inference_request.top_p,
-                # stop=["User:", "Question:"] # 可以根据需要添加停止词
+            sampling_params = cached_sampling_params(
+                inference_request.temperature,
+                inference_request.max_tokens,
+                inference_request.top_p
             )
             
-            # !!! 关键点 !!!
-            # vLLM 的 generate 是同步阻塞的，必须放入 executor 运行，
-            # 否则会阻塞整个 HTTP 服务器，导致无法处理其他并发请求。
-            # 我们复用 draft_verifier 里的 model (它是 LLM 实例)
-            loop = asyncio.get_event_loop()
-            
-            outputs = await loop.run_in_executor(
-                None,
-                lambda: self.draft_verifier.model.generate(
-                    [inference_request.prompt], 
-                    sampling_params
-                )
+            # vLLM 的 generate 是同步阻塞的，不能直接在事件循环里调用。
+            # 这里交给 draft_verifier 的微批队列: 与并发的验证/直接推理请求合并成一次 generate，
+            # 在 vLLM 专用线程池中执行，不阻塞 HTTP 服务器
+            completion = await self.draft_verifier.generate_completion(
+                inference_request.prompt,
+                sampling_params
             )
+            generated_text = completion.text if completion is not None else ""
             
-            # 获取生成结果 (Batch size = 1)
-            output = outputs[0]
-            generated_text = output.outputs[0].text
-            
-            # 简单分词用于前端展示 (vLLM 返回的是纯文本)
-            # 这里简单按空格切分，或者直接返回空列表让前端自己处理
-            tokens = [t for t in generated_text.split(' ') if t]
-            
-            latency = (time.time() - start_time) * 1000
-            print(f"☁️ [Cloud] 直接推理完成. 耗时: {latency:.1f}ms, 长度: {len(generated_text)}")
+            latency = (time.perf_counter() - start_time) * 1000
+            logger.debug('直接推理完成. 耗时: %.1fms, 长度: %d', latency, len(generated_text))
             
+            # 不再按空格切分 tokens 回传 (切分结果并不对应真实 token)，
+            # 只回传 vLLM 实际生成的 token 数，供边端记录执行历史
             result = {
                 'text': generated_text,
-                'tokens': tokens,
+                'num_tokens': len(completion.token_ids) if completion is not None else 0,
                 'latency_ms': latency,
                 'method': 'cloud_direct_vllm'
             }
@@ -168,9 +226,7 @@ class CloudServer:
             }
             
         except Exception as e:
-            print(f"❌ [Cloud] 直接推理失败: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception('直接推理失败: %s', e)
             return {
                 'type': 'error', 
                 'message': f"Cloud Inference Failed: {str(e)}"
@@ -179,11 +235,20 @@ class CloudServer:
     def _update_stats(self, verify_response: VerifyResponse):
         """更新统计信息"""
         self.stats['total_verifications'] += 1
+        self.stats['sum_acceptance_rate'] += verify_response.acceptance_rate
+        self.stats['sum_latency_ms'] += verify_response.latency_ms
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取统计信息 (按需计算平均值)"""
         n = self.stats['total_verifications']
         
-        # 增量更新平均值
-        self.stats['avg_acceptance_rate'] += (verify_response.acceptance_rate - self.stats['avg_acceptance_rate']) / n
-        self.stats['avg_latency_ms'] += (verify_response.latency_ms - self.stats['avg_latency_ms']) / n
+        return {
+            'total_requests': self.stats['total_requests'],
+            'total_verifications': n,
+            'avg_acceptance_rate': self.stats['sum_acceptance_rate'] / n if n else 0.0,
+            'avg_latency_ms': self.stats['sum_latency_ms'] / n if n else 0.0,
+            'avg_batch_size': self.draft_verifier.avg_batch_size()
+        }
     
     async def handle_health_check(self) -> Dict[str, Any]:
         """健康检查"""
@@ -194,7 +259,7 @@ class CloudServer:
         return {
             'status': 'healthy',
             'component': 'cloud',
-            'overall_stats': self.stats,
+            'overall_stats': self.get_stats(),
             'cache_stats': cache_stats
         }
     
@@ -202,15 +267,21 @@ class CloudServer:
         """批量验证请求 (可选功能)"""
         try:
             reqs_data = request_data.get('data', {}).get('requests', [])
-            tasks = []
-            for d in reqs_data:
-                req = VerifyRequest(**d)
-                tasks.append(self.draft_verifier.verify_draft(req))
+            reqs = [VerifyRequest(**d) for d in reqs_data]
+            
+            # 按 prompt 字典序提交: 等价于前缀树的先序遍历，共享前缀的请求相邻进入同一批，
+            # 便于 vLLM prefix caching 复用 KV 块；结果再按原顺序返回
+            order = sorted(range(len(reqs)), key=lambda i: reqs[i].prompt)
+            tasks = [self.draft_verifier.verify_draft(reqs[i]) for i in order]
+            
+            responses = [None] * len(reqs)
+            for i, r in zip(order, await asyncio.gather(*tasks)):
+                responses[i] = r
             
-            responses = await asyncio.gather(*tasks)
             return {
                 'type': 'batch_verify_response',
-                'data': {'results': [r.__dict__ for r in responses]}
+                # 直接交给 codec 一次性编码整个 dataclass 列表，不逐个构造 dict
+                'data': {'results': responses, 'count': len(responses)}
             }
         except Exception as e:
             return {'type': 'error', 'message': str(e)}
@@ -220,28 +291,60 @@ class CloudServer:
 
 async def handle_verify(request):
     server = request.app['cloud_server']
-    data = await request.json()
-    return web.json_response(await server.handle_verify_request(data))
+    data = await read_json(request)
+    return json_response(await server.handle_verify_request(data))
+
+async def handle_verify_stream(request):
+    """
+    流式验证 (NDJSON，每行一帧)
+    第一帧为乐观接受帧，边端收到后即可假设全部接受、提前起草下一轮；
+    第二帧为真实验证结果，若 rollback_from 非空则丢弃该位置之后的乐观内容。
+    """
+    server = request.app['cloud_server']
+    data = await read_json(request)
+    draft_tokens = data.get('data', {}).get('draft_tokens', [])
+    
+    response = web.StreamResponse(headers={'Content-Type': 'application/x-ndjson'})
+    await response.prepare(request)
+    
+    await response.write(dumps({
+        'type': MessageType.OPTIMISTIC_ACCEPT.value,
+        'prefix_len': sum(len(t) for t in draft_tokens)
+    }) + b'\n')
+    await response.write(dumps(await server.handle_verify_request(data)) + b'\n')
+    await response.write_eof()
+    
+    return response
+
+async def handle_verify_prefetch(request):
+    server = request.app['cloud_server']
+    data = await read_json(request)
+    return json_response(await server.handle_prefetch_request(data))
 
 async def handle_batch_verify(request):
     server = request.app['cloud_server']
-    data = await request.json()
-    return web.json_response(await server.handle_batch_verify(data))
+    data = await read_json(request)
+    return json_response(await server.handle_batch_verify(data))
 
 async def handle_direct_inference(request):
     server = request.app['cloud_server']
-    data = await request.json()
-    return web.json_response(await server.handle_direct_inference(data))
+    data = await read_json(request)
+    return json_response(await server.handle_direct_inference(data))
 
 async def handle_health(request):
     server = request.app['cloud_server']
-    return web.json_response(await server.handle_health_check())
+    return json_response(await server.handle_health_check())
 
 async def handle_cache_stats(request):
     server = request.app['cloud_server']
     if hasattr(server.kv_cache, 'get_cache_stats'):
-        return web.json_response(server.kv_cache.get_cache_stats())
-    return web.json_response({'status': 'no stats'})
+        return json_response(server.kv_cache.get_cache_stats())
+    return json_response({'status': 'no stats'})
+
+
+async def on_cleanup(app):
+    """应用关闭时释放云端服务器资源"""
+    await app['cloud_server'].stop()
 
 
 async def main():
@@ -256,9 +359,12 @@ async def main():
     
     app = web.Application()
     app['cloud_server'] = cloud_server
+    app.on_cleanup.append(on_cleanup)
     
     # 注册路由
     app.router.add_post('/verify', handle_verify)
+    app.router.add_post('/verify/stream', handle_verify_stream)
+    app.router.add_post('/verify/prefetch', handle_verify_prefetch)
     app.router.add_post('/verify/batch', handle_batch_verify)
     app.router.add_post('/inference/direct', handle_direct_inference) # <--- 确保这一行存在
     app.router.add_get('/health', handle_health)
@@ -266,7 +372,8 @@ async def main():
     
     print(f"[Cloud] Running on port {config['port']}...")
     
-    runner = web.AppRunner(app)
+    # 关闭 access log: 每个请求的格式化输出在高 QPS 下开销明显
+    runner = web.AppRunner(app, access_log=None)
     await runner.setup()
     site = web.TCPSite(runner, '0.0.0.0', config['port'])
     await site.start()
@@ -277,4 +384,6 @@ async def main():
         await runner.cleanup()
 
 if __name__ == '__main__':
+    if uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
     asyncio.run(main())
\ No newline at end of file
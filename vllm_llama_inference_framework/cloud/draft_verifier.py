@@ -3,7 +3,14 @@ F2: 云端 Draft 验证器 - 鲁棒匹配修复版
 使用最长公共前缀 (LCP) 算法，彻底解决 split(' ') 带来的错位问题
 """
 import asyncio
+import bisect
+import functools
+import itertools
+import logging
 import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Executor
 from typing import List, Tuple, Dict, Any, Optional
 
 try:
@@ -13,13 +20,114 @@ except ImportError:
     LLM = Any 
     SamplingParams = Any
 
+# 异步引擎可选: 可用时 generate 直接在事件循环内 await，由 vLLM 自身做连续批处理
+try:
+    from vllm import AsyncEngineArgs, AsyncLLMEngine
+except ImportError:
+    AsyncEngineArgs = None
+    AsyncLLMEngine = None
+
 from common.types import VerifyRequest, VerifyResponse
+from cloud.kv_cache import VLLMKVCache
+
+logger = logging.getLogger('cloud.verifier')
+
+# 标准答案比 draft 多生成的 token 数 (保证覆盖 draft 并给出修正)
+VERIFY_EXTRA_TOKENS = 20
+# 非严格模式下近期接受率很高时只多生成少量 token，确认 draft 之后的下一个 token 即可
+VERIFY_EXTRA_TOKENS_CONFIDENT = 5
+CONFIDENT_ACCEPTANCE_RATE = 0.95
+
+
+@functools.lru_cache(maxsize=256)
+def cached_sampling_params(temperature: float, max_tokens: int, top_p: float = 1.0):
+    """按 (temperature, max_tokens, top_p) 复用 SamplingParams，避免每个请求重新构造"""
+    return SamplingParams(
+        temperature=temperature,
+        max_tokens=max_tokens,
+        top_p=top_p
+    )
+
+
+def common_prefix_len(a: str, b: str) -> int:
+    """
+    计算两个字符串的最长公共前缀长度 (字符级)
+    
+    先整体比较 (完全接受是最常见的情况)；不一致时按 1, 2, 4, ... 倍增找到
+    包含首个差异的区间，再在区间内二分。每次比较都是切片的 C 层 memcmp，
+    Python 层只有 O(log n) 次迭代。
+    """
+    n = min(len(a), len(b))
+    if a[:n] == b[:n]:
+        return n
+    
+    # 倍增: 找到首个不一致的块 [lo, hi)
+    lo, step = 0, 1
+    while True:
+        hi = min(lo + step, n)
+        if a[lo:hi] != b[lo:hi]:
+            break
+        lo, step = hi, step * 2
+    
+    # 二分: 差异位置在 [lo, hi) 内
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if a[lo:mid] == b[lo:mid]:
+            lo = mid
+        else:
+            hi = mid
+    
+    return lo
+
 
 class DraftVerifier:
-    def __init__(self, model_path: str, acceptance_threshold: float = 0.8):
+    def __init__(
+        self,
+        model_path: str,
+        acceptance_threshold: float = 0.8,
+        enable_prefix_caching: bool = True,
+        speculative_model: Optional[str] = None,
+        num_speculative_tokens: int = 5,
+        max_batch_size: int = 32,
+        batch_timeout_ms: float = 5.0,
+        executor: Optional[Executor] = None,
+        kv_cache: Optional[VLLMKVCache] = None,
+        use_async_engine: bool = True,
+        strict_verify: bool = True
+    ):
         self.model_path = model_path
         self.acceptance_threshold = acceptance_threshold
+        self.enable_prefix_caching = enable_prefix_caching
+        self.speculative_model = speculative_model
+        self.num_speculative_tokens = num_speculative_tokens
+        self.executor = executor  # 运行 generate 的线程池，None 表示事件循环默认 executor
+        self.kv_cache = kv_cache  # 记录 prompt token 前缀，用于统计可复用的 KV 块
+        self.use_async_engine = use_async_engine
+        # strict_verify=False 时: 空 draft 直接返回，且近期接受率高时缩短标准答案长度
+        # (修正部分会变短，因此默认关闭)
+        self.strict_verify = strict_verify
+        self.acceptance_ewma = 0.0
         self.model = self._load_model(model_path)
+        self._is_async_engine = AsyncLLMEngine is not None and isinstance(self.model, AsyncLLMEngine)
+        
+        # 云端分词器: prompt 只分词一次 (按文本缓存)，之后以 token ID 形式送入 generate
+        self._tokenizer = self._get_tokenizer()
+        self._encode_prompt = functools.lru_cache(maxsize=1024)(
+            lambda prompt: tuple(self._tokenizer.encode(prompt))
+        )
+        
+        # 动态微批: 并发到达的验证请求在 batch_timeout_ms 窗口内合并为一次 generate
+        self.max_batch_size = max_batch_size
+        self.batch_timeout_ms = batch_timeout_ms
+        self._pending: List[Tuple[str, Optional[List[int]], Any, asyncio.Future]] = []
+        self._batch_event: Optional[asyncio.Event] = None
+        self._batch_task: Optional[asyncio.Task] = None
+        self.batch_stats = {'batches': 0, 'requests': 0}  # 用于观察窗口大小是否合适
+        
+        # 预取的标准答案任务: (prompt, prompt_token_ids) -> (max_tokens, Task)
+        # 边端起草的同时云端已开始生成，验证请求到达时直接复用
+        self.max_prefetch_tasks = max_batch_size * 4
+        self._prefetched: 'OrderedDict[Tuple[str, Optional[Tuple[int, ...]]], Tuple[int, asyncio.Task]]' = OrderedDict()
     
     def _load_model(self, model_path: str):
         print(f"[Cloud] 加载 vLLM 模型: {model_path} (TP自动适配)")
@@ -27,47 +135,93 @@ class DraftVerifier:
         gpu_count = torch.cuda.device_count()
         tp_size = 4 if gpu_count >= 4 else 1
         
+        engine_kwargs = dict(
+            model=model_path,
+            tensor_parallel_size=tp_size,
+            dtype="float16",
+            trust_remote_code=True,
+            gpu_memory_utilization=0.85,
+            max_model_len=2048,
+            enable_prefix_caching=self.enable_prefix_caching, # 共享前缀的请求复用 KV 块
+            enforce_eager=False
+        )
+        
+        # 配置了云端草稿模型时启用 vLLM 内置投机解码: 草稿与目标模型的校验
+        # 在引擎内的同一轮 forward 中完成，并随 enforce_eager=False 一起被 CUDA graph 捕获
+        if self.speculative_model:
+            print(f"[Cloud] 启用投机解码: {self.speculative_model} (K={self.num_speculative_tokens})")
+            engine_kwargs['speculative_model'] = self.speculative_model
+            engine_kwargs['num_speculative_tokens'] = self.num_speculative_tokens
+        
         try:
-            return LLM(
-                model=model_path,
-                tensor_parallel_size=tp_size,
-                dtype="float16",
-                trust_remote_code=True,
-                gpu_memory_utilization=0.85,
-                max_model_len=2048,
-                enforce_eager=False
-            )
+            if self.use_async_engine and AsyncLLMEngine is not None:
+                print("[Cloud] 使用 AsyncLLMEngine (无 executor 线程切换)")
+                return AsyncLLMEngine.from_engine_args(AsyncEngineArgs(**engine_kwargs))
+            return LLM(**engine_kwargs)
         except Exception as e:
             print(f"❌ vLLM 初始化失败: {e}")
             raise e
 
+    def _get_tokenizer(self):
+        """获取 vLLM 引擎内的分词器，不可用时返回 None (直接以文本送入 generate)"""
+        if self._is_async_engine:
+            # 异步引擎在自身的后台循环内分词，不在事件循环里同步分词
+            return None
+        try:
+            return self.model.get_tokenizer()
+        except Exception:
+            return None
+    
+    def _prompt_input(self, prompt: str, prompt_token_ids: Optional[List[int]]):
+        """构造 generate 的单条输入: 优先使用请求携带的 token ID，其次使用缓存的分词结果"""
+        if prompt_token_ids:
+            token_ids = tuple(prompt_token_ids)
+        elif self._tokenizer is not None:
+            token_ids = self._encode_prompt(prompt)
+        else:
+            return prompt
+        
+        if self.kv_cache is not None:
+            self.kv_cache.match_token_prefix(token_ids)
+        
+        return {'prompt_token_ids': list(token_ids)}
+
     async def verify_draft(self, request: VerifyRequest) -> VerifyResponse:
         """验证 Draft (字符串级精准匹配)"""
-        start_time = time.time()
+        start_time = time.perf_counter()
         
         full_prompt = request.prompt
         # 1. 还原端侧生成的完整字符串
         draft_text_raw = "".join(request.draft_tokens)
         
+        if not draft_text_raw and not self.strict_verify:
+            # 空草稿无需验证，不调用 vLLM
+            return VerifyResponse(
+                verified_tokens=["", ""],
+                verified_token_ids=[],
+                accepted_count=0,
+                total_count=0,
+                acceptance_rate=1.0,
+                corrected_positions=[],
+                final_text=full_prompt if request.return_final_text else None,
+                latency_ms=(time.perf_counter() - start_time) * 1000
+            )
+        
         # 2. 让云端生成标准答案 (Ground Truth)
         # 长度只要比 draft 稍微长一点即可，确保能覆盖
-        max_verify_len = len(request.draft_tokens) + 20
+        extra_tokens = VERIFY_EXTRA_TOKENS
+        if not self.strict_verify and self.acceptance_ewma > CONFIDENT_ACCEPTANCE_RATE:
+            extra_tokens = VERIFY_EXTRA_TOKENS_CONFIDENT
+        max_verify_len = len(request.draft_tokens) + extra_tokens
         
         cloud_generated_text = await self._generate_ground_truth(
             full_prompt, 
-            max_tokens=max_verify_len
+            max_tokens=max_verify_len,
+            prompt_token_ids=request.prompt_token_ids
         )
         
         # 3. 🚀 核心逻辑: 最长公共前缀匹配 (Character-level LCP)
-        match_len = 0
-        min_len = min(len(draft_text_raw), len(cloud_generated_text))
-        
-        # 逐字符比对
-        for i in range(min_len):
-            if draft_text_raw[i] == cloud_generated_text[i]:
-                match_len += 1
-            else:
-                break
+        match_len = common_prefix_len(draft_text_raw, cloud_generated_text)
         
         # 4. 判断结果
         # accepted_text 是 draft 中匹配成功的部分
@@ -88,23 +242,28 @@ class DraftVerifier:
         else:
             acceptance_rate = 1.0 # 空草稿算全对
             
-        print(f"[Cloud] 验证结果: Draft长={len(draft_text_raw)}, 匹配长={match_len}, 接受率={acceptance_rate:.1%}")
+        logger.debug('验证结果: Draft长=%d, 匹配长=%d, 接受率=%.3f', len(draft_text_raw), match_len, acceptance_rate)
+        self.acceptance_ewma = 0.9 * self.acceptance_ewma + 0.1 * acceptance_rate
         
         # 5. 构造最终输出
         # 最终文本 = Prompt + (匹配的 Draft 部分) + (Cloud 生成的剩余部分)
         # Cloud 生成的剩余部分 = cloud_generated_text[match_len:]
         correction = cloud_generated_text[match_len:]
-        final_text = accepted_text + correction
         
         # 为了兼容接口返回 tokens 列表，我们简单切分一下 (仅用于显示)
         # 注意：这里的 tokens 并不严格对应模型 tokenizer，仅供前端或日志查看
         verified_tokens = [accepted_text, correction] 
         
-        # 修正位置：这里不再返回具体的 token index 列表，因为字符级无法精确对应 token index
-        # 只要 acceptance_rate < 1.0，就说明末尾有修正
-        corrected_positions = [-1] if not is_fully_accepted else []
+        # 修正位置: 由 draft token 的累计字符长度定位首个未被完整接受的 token，
+        # 它及其之后的 token 都被修正
+        if is_fully_accepted:
+            corrected_positions = []
+        else:
+            cum_lengths = list(itertools.accumulate(len(t) for t in request.draft_tokens))
+            first_bad_token = bisect.bisect_right(cum_lengths, match_len)
+            corrected_positions = list(range(first_bad_token, len(request.draft_tokens)))
 
-        latency = (time.time() - start_time) * 1000
+        latency = (time.perf_counter() - start_time) * 1000
         
         return VerifyResponse(
             verified_tokens=verified_tokens,
@@ -113,20 +272,173 @@ class DraftVerifier:
             total_count=total_chars,  # 这里借用字段存字符数
             acceptance_rate=acceptance_rate,
             corrected_positions=corrected_positions,
-            final_text=full_prompt + final_text, # 返回包含 prompt 的全量文本
-            latency_ms=latency
+            # 返回包含 prompt 的全量文本 (调用方不需要时跳过拼接)
+            final_text=full_prompt + accepted_text + correction if request.return_final_text else None,
+            latency_ms=latency,
+            rollback_from=None if is_fully_accepted else match_len
         )
     
-    async def _generate_ground_truth(self, prompt: str, max_tokens: int) -> str:
-        """调用 vLLM 生成"""
-        sampling_params = SamplingParams(
-            temperature=0.0, # 验证必须用贪心
-            max_tokens=max_tokens
+    def prefetch_ground_truth(
+        self,
+        prompt: str,
+        draft_max_tokens: int,
+        prompt_token_ids: Optional[List[int]] = None
+    ) -> asyncio.Task:
+        """
+        提前启动标准答案生成 (需在事件循环内调用)
+        
+        边端开始起草时即可调用，云端生成与边端起草重叠；之后同一 prompt 的验证
+        请求直接复用该任务。draft_max_tokens 为边端计划的 draft 长度上限。
+        """
+        key = (prompt, tuple(prompt_token_ids) if prompt_token_ids else None)
+        max_tokens = draft_max_tokens + VERIFY_EXTRA_TOKENS
+        
+        entry = self._prefetched.get(key)
+        if entry is not None and entry[0] >= max_tokens and not entry[1].cancelled():
+            return entry[1]
+        if entry is not None:
+            entry[1].cancel()
+        
+        task = asyncio.get_running_loop().create_task(
+            self.generate(prompt, cached_sampling_params(0.0, max_tokens), prompt_token_ids)
         )
+        # 未被消费的结果不应产生 "exception was never retrieved" 警告
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._prefetched[key] = (max_tokens, task)
+        self._prefetched.move_to_end(key)
         
-        loop = asyncio.get_event_loop()
-        output = await loop.run_in_executor(
-            None, 
-            lambda: self.model.generate([prompt], sampling_params)
+        # 超出上限时丢弃最旧的预取 (已在生成中的不取消，只是不再被复用)
+        while len(self._prefetched) > self.max_prefetch_tasks:
+            self._prefetched.popitem(last=False)
+        
+        return task
+    
+    async def _generate_ground_truth(
+        self,
+        prompt: str,
+        max_tokens: int,
+        prompt_token_ids: Optional[List[int]] = None
+    ) -> str:
+        """调用 vLLM 生成标准答案 (验证必须用贪心)"""
+        key = (prompt, tuple(prompt_token_ids) if prompt_token_ids else None)
+        entry = self._prefetched.pop(key, None)
+        
+        if entry is not None:
+            prefetched_max_tokens, task = entry
+            if prefetched_max_tokens >= max_tokens:
+                # 贪心解码下更长的生成是较短生成的延续，可直接用于前缀匹配
+                try:
+                    return await asyncio.shield(task)
+                except asyncio.CancelledError:
+                    # 只有预取任务本身被取消时才重新生成，调用方被取消则照常抛出
+                    if not task.cancelled():
+                        raise
+                except Exception as e:
+                    logger.debug('预取生成失败，重新生成: %s', e)
+            else:
+                # 预取长度不足以覆盖 draft，取消后按实际长度重新生成
+                task.cancel()
+        
+        return await self.generate(
+            prompt,
+            cached_sampling_params(0.0, max_tokens),
+            prompt_token_ids=prompt_token_ids
         )
-        return output[0].outputs[0].text
\ No newline at end of file
+    
+    async def generate(
+        self,
+        prompt: str,
+        sampling_params: Any,
+        prompt_token_ids: Optional[List[int]] = None
+    ) -> str:
+        """提交单条生成到微批队列，与并发请求合并为一次 vLLM generate，返回生成文本"""
+        completion = await self.generate_completion(prompt, sampling_params, prompt_token_ids)
+        return completion.text if completion is not None else ""
+    
+    async def generate_completion(
+        self,
+        prompt: str,
+        sampling_params: Any,
+        prompt_token_ids: Optional[List[int]] = None
+    ) -> Any:
+        """同 generate，但返回 vLLM 的 CompletionOutput (含 text 与 token_ids)"""
+        if self._is_async_engine:
+            return await self._generate_async(prompt, sampling_params, prompt_token_ids)
+        
+        loop = asyncio.get_running_loop()
+        
+        if self._batch_task is None or self._batch_task.done() or self._batch_task.get_loop() is not loop:
+            self._batch_event = asyncio.Event()
+            self._batch_task = loop.create_task(self._batch_loop())
+        
+        future = loop.create_future()
+        self._pending.append((prompt, prompt_token_ids, sampling_params, future))
+        self._batch_event.set()
+        
+        return await future
+    
+    async def _generate_async(
+        self,
+        prompt: str,
+        sampling_params: Any,
+        prompt_token_ids: Optional[List[int]] = None
+    ) -> Any:
+        """AsyncLLMEngine 路径: 请求直接进入引擎的连续批处理，逐步产出直到完成"""
+        final_output = None
+        async for output in self.model.generate(
+            self._prompt_input(prompt, prompt_token_ids),
+            sampling_params,
+            request_id=uuid.uuid4().hex
+        ):
+            final_output = output
+        
+        return final_output.outputs[0] if final_output is not None else None
+    
+    def avg_batch_size(self) -> float:
+        """平均每次 generate 合并的请求数"""
+        batches = self.batch_stats['batches']
+        return self.batch_stats['requests'] / batches if batches else 0.0
+    
+    async def _batch_loop(self):
+        """后台批处理协程: 收集等待中的请求，一次 generate 后把结果分发回各自的 future"""
+        loop = asyncio.get_running_loop()
+        
+        while True:
+            await self._batch_event.wait()
+            
+            # 批未满时留一个很短的窗口，让同时到达的请求汇入同一批；
+            # batch_timeout_ms <= 0 时不等待 (压测框架自身开销时避免人为延迟)
+            if self.batch_timeout_ms > 0 and len(self._pending) < self.max_batch_size:
+                await asyncio.sleep(self.batch_timeout_ms / 1000)
+            
+            batch = self._pending[:self.max_batch_size]
+            del self._pending[:self.max_batch_size]
+            if not self._pending:
+                self._batch_event.clear()
+            
+            # 等待期间被取消的请求 (如作废的预取) 不再送入 generate
+            batch = [item for item in batch if not item[3].done()]
+            if not batch:
+                continue
+            
+            self.batch_stats['batches'] += 1
+            self.batch_stats['requests'] += len(batch)
+            
+            sampling_params = [params for _, _, params, _ in batch]
+            
+            def _sync_generate():
+                # 分词也放在 executor 线程内，避免占用事件循环
+                prompts = [self._prompt_input(prompt, ids) for prompt, ids, _, _ in batch]
+                return self.model.generate(prompts, sampling_params)
+            
+            try:
+                outputs = await loop.run_in_executor(self.executor, _sync_generate)
+            except Exception as e:
+                for _, _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            
+            for (_, _, _, future), output in zip(batch, outputs):
+                if not future.done():
+                    future.set_result(output.outputs[0])
@@ -3,11 +3,18 @@ F3: 云端 KV Cache 管理 (vLLM)
 """
 import time
 import json
-from typing import Dict, List, Optional, Any, Tuple, Set
-from collections import OrderedDict
+import hashlib
+from typing import Dict, List, Optional, Any, Tuple, Set, Sequence
+from collections import OrderedDict, deque
 import threading
 import asyncio
 
+# xxhash 可选: 存在时用 XXH3 计算 prompt 哈希，否则回退到 hashlib.blake2b
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
 
 class VLLMKVCache:
     """
@@ -26,7 +33,8 @@ class VLLMKVCache:
         block_size: int = 16,
         max_seq_len: int = 4096,
         enable_prefix_caching: bool = True,
-        enable_compression: bool = False
+        enable_compression: bool = False,
+        eviction_policy: str = "lru"
     ):
         self.max_blocks = max_blocks
         self.block_size = block_size
@@ -37,9 +45,19 @@ class VLLMKVCache:
         # 缓存结构: prompt_hash -> cache_blocks
         self.cache: Dict[str, Dict[str, Any]] = OrderedDict()
         
-        # 块分配表
-        self.block_table: Dict[int, Dict[str, Any]] = {}
-        self.next_block_id = 0
+        # 缓存条目淘汰策略: "lru" 使用 self.cache 自身的顺序；
+        # "arc" / "2q" 兼顾访问频率，避免一次性长 prompt 冲掉热点 (如系统提示词)
+        if eviction_policy not in EVICTION_POLICIES:
+            raise ValueError(f"未知的淘汰策略: {eviction_policy}")
+        self.eviction_policy_name = eviction_policy
+        policy_cls = EVICTION_POLICIES[eviction_policy]
+        self.eviction_policy = policy_cls(max_blocks) if policy_cls else None
+        
+        # 块分配表: block_id -> prompt_hash (按访问顺序排列: 表头为最久未使用的块，淘汰时从表头弹出)
+        self.block_table: Dict[int, str] = OrderedDict()
+        # 空闲块 ID: 预先放入 [0, max_blocks)，分配时弹出、淘汰时归还，ID 空间有界
+        self.block_id_capacity = max_blocks
+        self.free_block_ids: deque = deque(range(max_blocks))
         
         # 统计信息
         self.stats = {
@@ -51,11 +69,36 @@ class VLLMKVCache:
             'total_blocks_allocated': 0
         }
         
-        # 锁
+        # 锁: self.lock 保护块表/缓存条目；token 前缀树走推理热路径 (每次 generate 都会调用)，
+        # 单独使用 prefix_lock，避免与缓存簿记互相阻塞。需要同时持有时先取 self.lock
         self.lock = threading.Lock()
+        self.prefix_lock = threading.Lock()
         
         # 前缀树 (用于前缀匹配)
         self.prefix_tree = PrefixTree() if enable_prefix_caching else None
+        
+        # token ID 前缀树: 记录近期 prompt 的 token 序列，用于估计可复用的 KV 块
+        # (实际复用由 vLLM prefix caching 完成)；按 LRU 淘汰最久未使用的序列
+        self.token_prefix_tree = PrefixTree() if enable_prefix_caching else None
+        self.token_prefixes: Dict[Tuple[int, ...], int] = OrderedDict()
+        self.max_token_prefixes = max_blocks
+        self.prefix_stats = {
+            'prefix_hit_tokens': 0,
+            'prefix_total_tokens': 0
+        }
+    
+    @staticmethod
+    def hash_prompt(prompt: str) -> str:
+        """
+        计算 prompt 的缓存键 (128 位十六进制)
+        
+        cache / prefix_tree 的 prompt_hash 应统一由此生成；长 prompt 时哈希
+        是查找路径上的主要开销，XXH3 比 sha256 等密码学哈希快一个数量级
+        """
+        data = prompt.encode('utf-8')
+        if xxhash is not None:
+            return xxhash.xxh3_128_hexdigest(data)
+        return hashlib.blake2b(data, digest_size=16).hexdigest()
     
     def allocate_blocks(
         self, 
@@ -83,29 +126,33 @@ class VLLMKVCache:
                 blocks_to_evict = num_blocks - available_blocks
                 self._evict_blocks(blocks_to_evict)
             
+            # 单次请求超过 max_blocks 时空闲 ID 不够，扩充 ID 空间
+            if len(self.free_block_ids) < num_blocks:
+                self._grow_block_ids(len(self.block_table) + num_blocks)
+            
             # 分配新块
             for _ in range(num_blocks):
-                block_id = self.next_block_id
-                self.next_block_id += 1
-                
-                self.block_table[block_id] = {
-                    'block_id': block_id,
-                    'prompt_hash': prompt_hash,
-                    'allocated_at': time.time(),
-                    'last_access': time.time(),
-                    'access_count': 0,
-                    'tokens': []  # 实际存储的tokens
-                }
-                
+                block_id = self.free_block_ids.popleft()
+                self.block_table[block_id] = prompt_hash
                 allocated_blocks.append(block_id)
                 self.stats['total_blocks_allocated'] += 1
             
             return allocated_blocks
     
+    def _grow_block_ids(self, size: int):
+        """扩充块 ID 空间，并把新增的 ID 加入空闲列表 (调用方需持有 self.lock)"""
+        capacity = self.block_id_capacity
+        if size <= capacity:
+            return
+        
+        new_capacity = max(size, capacity * 2)
+        self.free_block_ids.extend(range(capacity, new_capacity))
+        self.block_id_capacity = new_capacity
+    
     def get_cache_blocks(
         self, 
         prompt_hash: str
-    ) -> Optional[List[int]]:
+    ) -> Optional[Tuple[int, ...]]:
         """
         获取缓存块
         
@@ -113,7 +160,7 @@ class VLLMKVCache:
             prompt_hash: 提示哈希
             
         Returns:
-            块ID列表或 None
+            块ID元组 (只读) 或 None
         """
         with self.lock:
             if prompt_hash not in self.cache:
@@ -123,22 +170,25 @@ class VLLMKVCache:
             cache_entry = self.cache[prompt_hash]
             blocks = cache_entry['block_ids']
             
-            # 更新访问时间
+            # 把块移到访问顺序末尾 (O(1))；访问时间/次数只记录在缓存条目上
+            now = time.time()
             for block_id in blocks:
                 if block_id in self.block_table:
-                    self.block_table[block_id]['last_access'] = time.time()
-                    self.block_table[block_id]['access_count'] += 1
+                    self.block_table.move_to_end(block_id)
             
-            cache_entry['last_access'] = time.time()
+            cache_entry['last_access'] = now
             cache_entry['access_count'] += 1
             
             # 移动到末尾 (LRU)
             self.cache.move_to_end(prompt_hash)
+            if self.eviction_policy:
+                self.eviction_policy.touch(prompt_hash)
             
             self.stats['hits'] += 1
             self.stats['block_hits'] += len(blocks)
             
-            return blocks.copy()
+            # 块列表以不可变元组存储，直接返回无需拷贝
+            return blocks
     
     def set_cache_blocks(
         self, 
@@ -158,16 +208,20 @@ class VLLMKVCache:
         """
         with self.lock:
             # 如果缓存已满，执行淘汰
-            if len(self.cache) >= self.max_blocks:
+            if self.eviction_policy:
+                for victim in self.eviction_policy.insert(prompt_hash):
+                    self._evict_cache_entry(victim)
+            elif len(self.cache) >= self.max_blocks:
                 self._evict_lru_blocks()
             
+            now = time.time()
             cache_entry = {
                 'prompt_hash': prompt_hash,
-                'block_ids': block_ids.copy(),
+                'block_ids': tuple(block_ids),
                 'seq_len': seq_len,
                 'num_blocks': len(block_ids),
-                'created_at': time.time(),
-                'last_access': time.time(),
+                'created_at': now,
+                'last_access': now,
                 'access_count': 1,
                 'metadata': metadata or {}
             }
@@ -178,38 +232,45 @@ class VLLMKVCache:
             if self.prefix_tree:
                 self.prefix_tree.insert(prompt_hash, seq_len)
     
+    def _free_block(self, block_id: int):
+        """释放块并回收其 ID (调用方需持有 self.lock)"""
+        if self.block_table.pop(block_id, None) is not None:
+            self.free_block_ids.append(block_id)
+    
     def _evict_blocks(self, num_blocks: int):
-        """淘汰指定数量的块"""
-        with self.lock:
-            blocks_to_remove = []
-            
-            # 找出最久未使用的块
-            sorted_blocks = sorted(
-                self.block_table.items(),
-                key=lambda x: x[1]['last_access']
-            )
-            
-            for i in range(min(num_blocks, len(sorted_blocks))):
-                block_id = sorted_blocks[i][0]
-                blocks_to_remove.append(block_id)
-            
-            # 移除块
-            for block_id in blocks_to_remove:
-                prompt_hash = self.block_table[block_id]['prompt_hash']
-                del self.block_table[block_id]
-                
-                # 从缓存中移除对应的块
-                if prompt_hash in self.cache:
-                    cache_entry = self.cache[prompt_hash]
-                    if block_id in cache_entry['block_ids']:
-                        cache_entry['block_ids'].remove(block_id)
-                        cache_entry['num_blocks'] -= 1
-                        
-                        # 如果该缓存没有块了，删除缓存条目
-                        if not cache_entry['block_ids']:
-                            del self.cache[prompt_hash]
-                
-                self.stats['evictions'] += 1
+        """淘汰指定数量的最久未使用块 (调用方需持有 self.lock)"""
+        for _ in range(min(num_blocks, len(self.block_table))):
+            # block_table 按访问顺序排列，表头即最久未使用的块
+            block_id, prompt_hash = self.block_table.popitem(last=False)
+            self.free_block_ids.append(block_id)
+            
+            # 从缓存中移除对应的块
+            if prompt_hash in self.cache:
+                cache_entry = self.cache[prompt_hash]
+                if block_id in cache_entry['block_ids']:
+                    cache_entry['block_ids'] = tuple(
+                        b for b in cache_entry['block_ids'] if b != block_id
+                    )
+                    cache_entry['num_blocks'] -= 1
+                    
+                    # 如果该缓存没有块了，删除缓存条目
+                    if not cache_entry['block_ids']:
+                        del self.cache[prompt_hash]
+                        if self.eviction_policy:
+                            self.eviction_policy.discard(prompt_hash)
+            
+            self.stats['evictions'] += 1
+    
+    def _evict_cache_entry(self, prompt_hash: str):
+        """淘汰策略选中的缓存条目 (调用方需持有 self.lock)"""
+        cache_entry = self.cache.pop(prompt_hash, None)
+        if cache_entry is None:
+            return
+        
+        for block_id in cache_entry['block_ids']:
+            self._free_block(block_id)
+        
+        self.stats['evictions'] += 1
     
     def _evict_lru_blocks(self):
         """LRU 淘汰块"""
@@ -221,8 +282,7 @@ class VLLMKVCache:
         
         # 移除对应的块
         for block_id in oldest_entry['block_ids']:
-            if block_id in self.block_table:
-                del self.block_table[block_id]
+            self._free_block(block_id)
         
         self.stats['evictions'] += 1
     
@@ -256,99 +316,415 @@ class VLLMKVCache:
                     # 更新访问统计
                     cache_entry['last_access'] = time.time()
                     cache_entry['access_count'] += 1
+                    if self.eviction_policy:
+                        self.eviction_policy.touch(prompt_hash)
                     
                     self.stats['hits'] += 1
                     
                     return {
                         'matched_hash': prompt_hash,
                         'matched_len': match['match_len'],
-                        'block_ids': cache_entry['block_ids'].copy(),
+                        'block_ids': cache_entry['block_ids'],
                         'seq_len': cache_entry['seq_len']
                     }
             
             self.stats['misses'] += 1
             return None
     
+    def match_token_prefix(
+        self, 
+        token_ids: Tuple[int, ...],
+        insert: bool = True
+    ) -> int:
+        """
+        查找与已记录序列共享的最长 token 前缀，并 (可选) 记录本次序列
+        
+        Args:
+            token_ids: prompt 的 token ID 序列
+            insert: 是否把本次序列加入前缀树
+            
+        Returns:
+            可复用的完整 KV 块数
+        """
+        if not self.token_prefix_tree:
+            return 0
+        
+        token_ids = tuple(token_ids)
+        
+        with self.prefix_lock:
+            match_len = self.token_prefix_tree.match_length(token_ids)
+            
+            self.prefix_stats['prefix_hit_tokens'] += match_len
+            self.prefix_stats['prefix_total_tokens'] += len(token_ids)
+            
+            if insert and token_ids:
+                if token_ids in self.token_prefixes:
+                    self.token_prefixes.move_to_end(token_ids)
+                else:
+                    if len(self.token_prefixes) >= self.max_token_prefixes:
+                        oldest, _ = self.token_prefixes.popitem(last=False)
+                        self.token_prefix_tree.remove(oldest)
+                    self.token_prefixes[token_ids] = len(token_ids)
+                    self.token_prefix_tree.insert(token_ids, len(token_ids))
+            
+            return match_len // self.block_size
+    
     def clear_all_cache(self):
         """清空所有缓存"""
-        with self.lock:
+        with self.lock, self.prefix_lock:
             self.cache.clear()
             self.block_table.clear()
-            self.next_block_id = 0
+            self.free_block_ids = deque(range(self.block_id_capacity))
+            if self.eviction_policy:
+                self.eviction_policy.clear()
             
             if self.prefix_tree:
                 self.prefix_tree.clear()
             
-            self.stats = {
-                'hits': 0,
-                'misses': 0,
-                'block_hits': 0,
-                'block_misses': 0,
-                'evictions': 0,
-                'total_blocks_allocated': 0
-            }
+            if self.token_prefix_tree:
+                self.token_prefix_tree.clear()
+            self.token_prefixes.clear()
+            
+            # 计数器原地清零 (读取方持有的引用始终有效)
+            for key in self.prefix_stats:
+                self.prefix_stats[key] = 0
+            for key in self.stats:
+                self.stats[key] = 0
     
     def get_cache_stats(self) -> Dict[str, Any]:
-        """获取缓存统计"""
-        with self.lock:
-            total_requests = self.stats['hits'] + self.stats['misses']
-            hit_rate = self.stats['hits'] / total_requests if total_requests > 0 else 0.0
-            block_hit_rate = self.stats['block_hits'] / (self.stats['block_hits'] + self.stats['block_misses']) if (self.stats['block_hits'] + self.stats['block_misses']) > 0 else 0.0
-            
-            return {
-                'cache_entries': len(self.cache),
-                'allocated_blocks': len(self.block_table),
-                'max_blocks': self.max_blocks,
-                'block_utilization': len(self.block_table) / self.max_blocks,
-                'hit_rate': hit_rate,
-                'block_hit_rate': block_hit_rate,
-                'hits': self.stats['hits'],
-                'misses': self.stats['misses'],
-                'block_hits': self.stats['block_hits'],
-                'block_misses': self.stats['block_misses'],
-                'evictions': self.stats['evictions'],
-                'total_blocks_allocated': self.stats['total_blocks_allocated']
-            }
+        """
+        获取缓存统计
+        
+        不获取锁: 计数器快照 (dict 拷贝与 len) 在 GIL 下是原子的，
+        监控轮询不会与分配/淘汰争用锁；各计数器之间可能相差一次进行中的更新
+        """
+        counters = dict(self.stats)
+        prefix_counters = dict(self.prefix_stats)
+        cache_entries = len(self.cache)
+        allocated_blocks = len(self.block_table)
+        
+        total_requests = counters['hits'] + counters['misses']
+        hit_rate = counters['hits'] / total_requests if total_requests > 0 else 0.0
+        total_block_lookups = counters['block_hits'] + counters['block_misses']
+        block_hit_rate = counters['block_hits'] / total_block_lookups if total_block_lookups > 0 else 0.0
+        hit_tokens = prefix_counters['prefix_hit_tokens']
+        total_tokens = prefix_counters['prefix_total_tokens']
+        
+        return {
+            'eviction_policy': self.eviction_policy_name,
+            'cache_entries': cache_entries,
+            'allocated_blocks': allocated_blocks,
+            'max_blocks': self.max_blocks,
+            'block_utilization': allocated_blocks / self.max_blocks,
+            'hit_rate': hit_rate,
+            'block_hit_rate': block_hit_rate,
+            'hits': counters['hits'],
+            'misses': counters['misses'],
+            'block_hits': counters['block_hits'],
+            'block_misses': counters['block_misses'],
+            'evictions': counters['evictions'],
+            'total_blocks_allocated': counters['total_blocks_allocated'],
+            'prefix_hit_rate': hit_tokens / total_tokens if total_tokens > 0 else 0.0,
+            'prefix_hit_tokens': hit_tokens
+        }
+
+class RadixNode:
+    """基数树节点: 一条边保存一整段键 (字符串片段或 token ID 元组片段)"""
+    
+    __slots__ = ('label', 'children', 'value', 'key')
+    
+    def __init__(self, label: Sequence, value: Optional[int] = None, key: Optional[Sequence] = None):
+        self.label = label
+        self.children: Dict[Any, 'RadixNode'] = {}  # 子边首元素 -> 子节点
+        self.value = value
+        self.key = key  # 非 None 表示有键在此结束
+
+
+def _shared_len(label: Sequence, seq: Sequence, pos: int) -> int:
+    """边 label 与 seq[pos:] 的公共前缀长度 (整段相等时走切片比较的快速路径)"""
+    segment = seq[pos:pos + len(label)]
+    if segment == label:
+        return len(label)
+    
+    n = 0
+    for x, y in zip(label, segment):
+        if x != y:
+            break
+        n += 1
+    return n
 
 
 class PrefixTree:
-    """前缀树，用于高效的前缀匹配"""
+    """
+    前缀树，用于高效的前缀匹配 (键可以是字符串或 token ID 元组)
+    
+    采用基数树 (路径压缩): 每条边保存一段连续的键，遍历时按整段切片比较，
+    而不是每个字符一次字典查找
+    """
     
     def __init__(self):
-        self.root = {}
+        self.root = RadixNode("")
     
-    def insert(self, key: str, value: int):
+    def insert(self, key: Sequence, value: int):
         """插入键值对"""
         node = self.root
-        for char in key:
-            if char not in node:
-                node[char] = {}
-            node = node[char]
-        node['__value__'] = value
-        node['__key__'] = key
+        pos = 0
+        
+        while pos < len(key):
+            child = node.children.get(key[pos])
+            if child is None:
+                node.children[key[pos]] = RadixNode(key[pos:], value, key)
+                return
+            
+            shared = _shared_len(child.label, key, pos)
+            if shared < len(child.label):
+                # 在首个分歧处拆分边
+                middle = RadixNode(child.label[:shared])
+                child.label = child.label[shared:]
+                middle.children[child.label[0]] = child
+                node.children[key[pos]] = middle
+                child = middle
+            
+            node = child
+            pos += shared
+        
+        node.value = value
+        node.key = key
     
     def find_longest_match(self, prefix: str) -> Optional[Dict[str, Any]]:
         """查找最长匹配"""
         node = self.root
+        pos = 0
         best_match = None
         
-        for i, char in enumerate(prefix):
-            if char not in node:
+        while pos < len(prefix):
+            child = node.children.get(prefix[pos])
+            if child is None or prefix[pos:pos + len(child.label)] != child.label:
                 break
-            node = node[char]
+            node = child
+            pos += len(child.label)
             
-            if '__value__' in node:
+            if node.key is not None:
                 best_match = {
-                    'key': node['__key__'],
-                    'value': node['__value__'],
-                    'match_len': i + 1
+                    'key': node.key,
+                    'value': node.value,
+                    'match_len': pos
                 }
         
         return best_match
     
+    def match_length(self, seq: Sequence) -> int:
+        """与树中任意已插入键共享的最长前缀长度"""
+        node = self.root
+        pos = 0
+        
+        while pos < len(seq):
+            child = node.children.get(seq[pos])
+            if child is None:
+                break
+            shared = _shared_len(child.label, seq, pos)
+            pos += shared
+            if shared < len(child.label):
+                break
+            node = child
+        
+        return pos
+    
+    def remove(self, key: Sequence):
+        """删除键，并剪除/合并不再被其他键共享的节点"""
+        path = [self.root]
+        node = self.root
+        pos = 0
+        
+        while pos < len(key):
+            child = node.children.get(key[pos])
+            if child is None or key[pos:pos + len(child.label)] != child.label:
+                return
+            node = child
+            pos += len(child.label)
+            path.append(node)
+        
+        if node.key is None:
+            return
+        node.key = None
+        node.value = None
+        
+        # 叶子节点直接删除，其父节点可能因此只剩一个子节点
+        if node is not self.root and not node.children:
+            path.pop()
+            del path[-1].children[node.label[0]]
+            node = path[-1]
+        
+        # 无值且只有一个子节点的中间节点与子节点合并
+        if node is not self.root and node.key is None and len(node.children) == 1:
+            (child,) = node.children.values()
+            child.label = node.label + child.label
+            path[-2].children[child.label[0]] = child
+    
     def clear(self):
         """清空前缀树"""
-        self.root.clear()
+        self.root = RadixNode("")
+
+class ARCCachePolicy:
+    """
+    自适应替换缓存 (ARC, Megiddo & Modha)
+    
+    T1: 只访问过一次的条目, T2: 访问过多次的条目 (均按 LRU 排列)
+    B1/B2: 最近从 T1/T2 淘汰的幽灵键 (只记键不存数据)
+    p: T1 的目标大小，B1 幽灵命中时增大 (偏向新近性)，B2 幽灵命中时减小 (偏向频率)
+    """
+    
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.p = 0.0
+        self.t1: 'OrderedDict[str, None]' = OrderedDict()
+        self.t2: 'OrderedDict[str, None]' = OrderedDict()
+        self.b1: 'OrderedDict[str, None]' = OrderedDict()
+        self.b2: 'OrderedDict[str, None]' = OrderedDict()
+    
+    def touch(self, key: str):
+        """缓存命中: 移到 T2 的 MRU 端"""
+        if key in self.t1:
+            del self.t1[key]
+            self.t2[key] = None
+        elif key in self.t2:
+            self.t2.move_to_end(key)
+    
+    def insert(self, key: str) -> List[str]:
+        """
+        写入新条目
+        
+        Returns:
+            需要从缓存中淘汰的键
+        """
+        if key in self.t1 or key in self.t2:
+            self.touch(key)
+            return []
+        
+        victims = []
+        c = self.capacity
+        
+        if key in self.b1:
+            self.p = min(c, self.p + max(len(self.b2) / len(self.b1), 1))
+            del self.b1[key]
+            victims += self._replace(in_b2=False)
+            self.t2[key] = None
+            return victims
+        
+        if key in self.b2:
+            self.p = max(0.0, self.p - max(len(self.b1) / len(self.b2), 1))
+            del self.b2[key]
+            victims += self._replace(in_b2=True)
+            self.t2[key] = None
+            return victims
+        
+        l1 = len(self.t1) + len(self.b1)
+        total = l1 + len(self.t2) + len(self.b2)
+        
+        if l1 >= c:
+            if len(self.t1) < c:
+                self.b1.popitem(last=False)
+                victims += self._replace(in_b2=False)
+            else:
+                victim, _ = self.t1.popitem(last=False)
+                victims.append(victim)
+        elif total >= c:
+            if total >= 2 * c:
+                self.b2.popitem(last=False)
+            victims += self._replace(in_b2=False)
+        
+        self.t1[key] = None
+        return victims
+    
+    def _replace(self, in_b2: bool) -> List[str]:
+        """缓存已满时从 T1 或 T2 淘汰一个条目到对应的幽灵列表"""
+        if len(self.t1) + len(self.t2) < self.capacity:
+            return []
+        
+        if self.t1 and (len(self.t1) > self.p or (in_b2 and len(self.t1) == self.p)):
+            victim, _ = self.t1.popitem(last=False)
+            self.b1[victim] = None
+        else:
+            victim, _ = self.t2.popitem(last=False)
+            self.b2[victim] = None
+        return [victim]
+    
+    def discard(self, key: str):
+        """条目被外部移除 (如块级淘汰清空了该条目)"""
+        self.t1.pop(key, None)
+        self.t2.pop(key, None)
+    
+    def clear(self):
+        self.p = 0.0
+        self.t1.clear()
+        self.t2.clear()
+        self.b1.clear()
+        self.b2.clear()
+
+
+class TwoQCachePolicy:
+    """
+    2Q 淘汰策略 (Johnson & Shasha, 简化版)
+    
+    A1in: 首次访问的条目 (FIFO, 容量约 1/4)
+    A1out: 从 A1in 淘汰的幽灵键 (容量约 1/2)，再次写入时直接进入 Am
+    Am: 多次访问的热点条目 (LRU)
+    """
+    
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.kin = max(1, capacity // 4)
+        self.kout = max(1, capacity // 2)
+        self.a1in: 'OrderedDict[str, None]' = OrderedDict()
+        self.a1out: 'OrderedDict[str, None]' = OrderedDict()
+        self.am: 'OrderedDict[str, None]' = OrderedDict()
+    
+    def touch(self, key: str):
+        """缓存命中: Am 中的条目移到 MRU 端 (A1in 中的条目保持 FIFO 位置)"""
+        if key in self.am:
+            self.am.move_to_end(key)
+    
+    def insert(self, key: str) -> List[str]:
+        """写入新条目，返回需要从缓存中淘汰的键"""
+        if key in self.a1in or key in self.am:
+            self.touch(key)
+            return []
+        
+        victims = []
+        if len(self.a1in) + len(self.am) >= self.capacity:
+            if len(self.a1in) > self.kin or not self.am:
+                victim, _ = self.a1in.popitem(last=False)
+                self.a1out[victim] = None
+                if len(self.a1out) > self.kout:
+                    self.a1out.popitem(last=False)
+            else:
+                victim, _ = self.am.popitem(last=False)
+            victims.append(victim)
+        
+        if key in self.a1out:
+            del self.a1out[key]
+            self.am[key] = None
+        else:
+            self.a1in[key] = None
+        return victims
+    
+    def discard(self, key: str):
+        """条目被外部移除"""
+        self.a1in.pop(key, None)
+        self.am.pop(key, None)
+    
+    def clear(self):
+        self.a1in.clear()
+        self.a1out.clear()
+        self.am.clear()
+
+
+# 淘汰策略名 -> 实现类 (None 表示使用 self.cache 自身的 LRU 顺序)
+EVICTION_POLICIES = {
+    'lru': None,
+    'arc': ARCCachePolicy,
+    '2q': TwoQCachePolicy
+}
 
 
 class VLLMKVCacheManager:
@@ -439,8 +815,7 @@ class AblatedVLLMKVCache(VLLMKVCache):
             if self.cache:
                 oldest_hash, oldest_entry = self.cache.popitem(last=False)
                 for block_id in oldest_entry['block_ids']:
-                    if block_id in self.block_table:
-                        del self.block_table[block_id]
+                    self._free_block(block_id)
                 self.stats['evictions'] += 1
         else:
             super()._evict_lru_blocks()
@@ -0,0 +1,63 @@
+"""
+F4: JSON 编解码模块
+边端/云端 HTTP 收发统一使用的序列化工具
+"""
+import dataclasses
+import json
+from enum import Enum
+from typing import Any
+
+import numpy as np
+from aiohttp import web
+
+# orjson 可选: 存在时使用原生实现，否则回退到标准库 json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+JSON_CONTENT_TYPE = 'application/json'
+
+
+def _default(obj: Any) -> Any:
+    """标准库 json 无法直接处理的类型 (orjson 已原生支持 dataclass / Enum)"""
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    if isinstance(obj, Enum):
+        return obj.value
+    if isinstance(obj, (np.ndarray, np.generic)):
+        return obj.tolist()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+if orjson is not None:
+    _ORJSON_OPTS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj: Any) -> bytes:
+        """序列化为 UTF-8 JSON 字节串"""
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTS)
+
+    def loads(data: Any) -> Any:
+        """从 bytes / str 解析 JSON"""
+        return orjson.loads(data)
+else:
+    def dumps(obj: Any) -> bytes:
+        """序列化为 UTF-8 JSON 字节串"""
+        return json.dumps(
+            obj, default=_default, ensure_ascii=False, separators=(',', ':')
+        ).encode('utf-8')
+
+    def loads(data: Any) -> Any:
+        """从 bytes / str 解析 JSON"""
+        return json.loads(data)
+
+
+def json_response(obj: Any, status: int = 200) -> web.Response:
+    """构造 JSON 响应 (替代 web.json_response，避免其内部的标准库编码)"""
+    return web.Response(body=dumps(obj), status=status, content_type=JSON_CONTENT_TYPE)
+
+
+async def read_json(request: web.Request) -> Any:
+    """读取并解析请求体 JSON (替代 request.json())"""
+    return loads(await request.read())
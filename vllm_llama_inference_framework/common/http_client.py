@@ -2,16 +2,33 @@
 F4: HTTP 客户端模块
 简单的 HTTP 客户端，用于边端和云端的通信
 """
+import array
 import asyncio
+import atexit
+import dataclasses
 import json
-from typing import Dict, Any, Optional, List
+import logging
+import random
+import threading
+from typing import Dict, Any, Optional, List, AsyncIterator
 import aiohttp
 import time
-from urllib.parse import urljoin
+import numpy as np
 
+# uvloop 可选: 存在时 SimpleHTTPClient 的后台循环使用 libuv 实现
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+from common.codec import dumps, loads, JSON_CONTENT_TYPE
 from common.types import (
     DraftRequest, 
     DraftResponse,
+    ConfidenceMetrics,
+    ConfidenceStrategy,
+    TokenProb,
+    KVCacheInfo,
     VerifyRequest,
     VerifyResponse,
     MessageType,
@@ -20,6 +37,52 @@ from common.types import (
 )
 
 
+_JSON_HEADERS = {'Content-Type': JSON_CONTENT_TYPE}
+
+# 消息类型字符串 (模块加载时取一次 .value)
+_MT_DRAFT_REQ = MessageType.DRAFT_REQUEST.value
+_MT_DRAFT_RESP = MessageType.DRAFT_RESPONSE.value
+_MT_VERIFY_REQ = MessageType.VERIFY_REQUEST.value
+_MT_VERIFY_RESP = MessageType.VERIFY_RESPONSE.value
+_MT_HEALTH_CHECK = MessageType.HEALTH_CHECK.value
+_MT_BATCH_VERIFY_REQ = 'batch_verify_request'
+_MT_BATCH_VERIFY_RESP = 'batch_verify_response'
+
+# 单次重试等待的上限 (秒)
+MAX_RETRY_DELAY = 10.0
+
+# 延迟统计窗口: 只保留最近 N 次成功请求的延迟 (N 为 2 的幂，下标用位与取模)
+LATENCY_WINDOW = 1024
+
+# 请求计数数组的下标
+_N_SUCCESS = 0
+_N_ERRORS = 1
+
+def _decode_draft_response(data: Dict[str, Any], decode_token_probs: bool = True) -> DraftResponse:
+    """
+    从响应字典还原 DraftResponse (confidence 还原为 ConfidenceMetrics)
+    
+    decode_token_probs=False 时 token_probs 保留为原始字典列表，不逐个构造 TokenProb；
+    只需要 confidence_score 等标量做阈值判断时使用 (token_probs 通常是响应中最大的字段)
+    """
+    confidence = dict(data['confidence'])
+    confidence['strategy'] = ConfidenceStrategy(confidence['strategy'])
+    if decode_token_probs:
+        confidence['token_probs'] = [TokenProb(**tp) for tp in confidence['token_probs']]
+    
+    return DraftResponse(
+        draft_tokens=data['draft_tokens'],
+        draft_token_ids=data['draft_token_ids'],
+        confidence=ConfidenceMetrics(**confidence),
+        kv_cache_info=KVCacheInfo(**data['kv_cache_info']),
+        latency_ms=data['latency_ms']
+    )
+
+
+# 'http' 的子日志器: 服务器初始化队列日志后经同一个后台队列输出
+logger = logging.getLogger('http.client')
+
+
 class HTTPClient:
     """
     HTTP 客户端
@@ -31,6 +94,14 @@ class HTTPClient:
     4. 请求/响应日志
     """
     
+    # 各端点的固定路径 (相对 session 的 base_url 解析)
+    _DRAFT_URL = '/draft'
+    _VERIFY_URL = '/verify'
+    _INFERENCE_URL = '/inference'
+    _BATCH_VERIFY_URL = '/verify/batch'
+    _HEALTH_URL = '/health'
+    _CACHE_STATS_URL = '/cache/stats'
+    
     def __init__(
         self, 
         base_url: str,
@@ -43,16 +114,21 @@ class HTTPClient:
         self.max_retries = max_retries
         self.retry_delay = retry_delay
         
+        # 重试退避表: 指数退避 (上限 MAX_RETRY_DELAY) + 最多 10% 的随机抖动，避免大量客户端同时重试
+        self._backoff = tuple(
+            min(retry_delay * (2 ** i), MAX_RETRY_DELAY) + random.uniform(0, retry_delay * 0.1)
+            for i in range(max_retries)
+        )
+        
         # 会话
         self.session: Optional[aiohttp.ClientSession] = None
         
-        # 统计
-        self.stats = {
-            'requests_sent': 0,
-            'responses_received': 0,
-            'errors': 0,
-            'avg_latency_ms': 0.0
-        }
+        # 统计: 热路径上只累加计数数组，get_client_stats 时再汇总成字典
+        # (requests_sent = responses_received + errors，不单独计数)
+        self._counts = array.array('Q', [0, 0])
+        
+        # 最近 LATENCY_WINDOW 次延迟 (ms) 的环形缓冲，均值/分位数在 get_client_stats 时计算
+        self._lat_ring = np.zeros(LATENCY_WINDOW, dtype=np.float32)
     
     async def __aenter__(self):
         await self.start()
@@ -63,15 +139,19 @@ class HTTPClient:
     
     async def start(self):
         """启动客户端"""
+        # TCP_NODELAY 由 aiohttp 在建立连接时默认开启 (小请求体不受 Nagle 合并延迟影响)
         connector = aiohttp.TCPConnector(
             limit=50,  # 连接池大小
-            limit_per_host=20
+            limit_per_host=20,
+            ttl_dns_cache=300,  # 边云地址固定，DNS 结果缓存 5 分钟
+            keepalive_timeout=75  # 请求间隔较长时也复用连接，避免重新握手
         )
         
         self.session = aiohttp.ClientSession(
             base_url=self.base_url,
             timeout=self.timeout,
-            connector=connector
+            connector=connector,
+            skip_auto_headers=('User-Agent',)
         )
     
     async def stop(self):
@@ -83,7 +163,7 @@ class HTTPClient:
         self, 
         method: str,
         endpoint: str,
-        data: Optional[Dict[str, Any]] = None
+        data: Optional[Any] = None
     ) -> Dict[str, Any]:
         """
         发送 HTTP 请求 (带重试)
@@ -97,20 +177,22 @@ class HTTPClient:
             响应数据
         """
         start_time = time.time()
+        # 请求体由 codec 一次编码为字节 (orjson 可用时不经过标准库 json)，重试时复用
+        body = dumps(data) if data is not None else None
         
         for attempt in range(self.max_retries + 1):
             try:
                 if not self.session:
                     await self.start()
                 
-                url = urljoin(self.base_url, endpoint)
-                
+                # endpoint 由 aiohttp 相对 session 的 base_url 解析，无需每次 urljoin
                 async with self.session.request(
-                    method=method,
-                    url=url,
-                    json=data
+                    method,
+                    endpoint,
+                    data=body,
+                    headers=_JSON_HEADERS
                 ) as response:
-                    response_data = await response.json()
+                    response_data = loads(await response.read())
                     
                     # 更新统计
                     self._update_stats(time.time() - start_time, success=True)
@@ -118,33 +200,32 @@ class HTTPClient:
                     return response_data
             
             except Exception as e:
-                print(f"[HTTP] 请求失败 (尝试 {attempt + 1}/{self.max_retries + 1}): {e}")
+                logger.warning('请求失败 (尝试 %d/%d): %s', attempt + 1, self.max_retries + 1, e)
                 
                 if attempt < self.max_retries:
-                    await asyncio.sleep(self.retry_delay * (2 ** attempt))
+                    await asyncio.sleep(self._backoff[attempt])
                 else:
                     self._update_stats(time.time() - start_time, success=False)
                     raise
     
     def _update_stats(self, latency: float, success: bool):
         """更新统计"""
-        self.stats['requests_sent'] += 1
-        
         if success:
-            self.stats['responses_received'] += 1
-            
-            # 更新平均延迟
-            n = self.stats['responses_received']
-            old_avg = self.stats['avg_latency_ms']
-            new_latency = latency * 1000
-            self.stats['avg_latency_ms'] = (old_avg * (n - 1) + new_latency) / n
+            # 成功计数同时作为延迟环形缓冲的写入下标
+            n = self._counts[_N_SUCCESS]
+            self._lat_ring[n & (LATENCY_WINDOW - 1)] = latency * 1000
+            self._counts[_N_SUCCESS] = n + 1
         else:
-            self.stats['errors'] += 1
+            self._counts[_N_ERRORS] += 1
+    
+    # send_* 方法把请求 dataclass 直接放进消息信封，由 codec 一次编码
+    # (不先转成字典)；信封中的 type 字段是边端/云端处理器的分发依据，保留
     
     async def send_draft_request(
         self, 
         draft_request: DraftRequest,
-        endpoint: str = '/draft'
+        endpoint: str = _DRAFT_URL,
+        decode_token_probs: bool = True
     ) -> DraftResponse:
         """
         发送 Draft 生成请求
@@ -152,27 +233,27 @@ class HTTPClient:
         Args:
             draft_request: Draft 请求
             endpoint: 端点
+            decode_token_probs: 是否把 token_probs 还原为 TokenProb (否则保留原始字典)
             
         Returns:
             Draft 响应
         """
         request_data = {
-            'type': MessageType.DRAFT_REQUEST.value,
-            'data': draft_request.__dict__
+            'type': _MT_DRAFT_REQ,
+            'data': draft_request
         }
         
         response_data = await self._send_request('POST', endpoint, request_data)
         
-        if response_data.get('type') == MessageType.DRAFT_RESPONSE.value:
-            data = response_data['data']
-            return DraftResponse(**data)
+        if response_data.get('type') == _MT_DRAFT_RESP:
+            return _decode_draft_response(response_data['data'], decode_token_probs)
         else:
             raise ValueError(f"Unexpected response type: {response_data.get('type')}")
     
     async def send_verify_request(
         self, 
         verify_request: VerifyRequest,
-        endpoint: str = '/verify'
+        endpoint: str = _VERIFY_URL
     ) -> VerifyResponse:
         """
         发送 Draft 验证请求
@@ -185,13 +266,13 @@ class HTTPClient:
             验证响应
         """
         request_data = {
-            'type': MessageType.VERIFY_REQUEST.value,
-            'data': verify_request.__dict__
+            'type': _MT_VERIFY_REQ,
+            'data': verify_request
         }
         
         response_data = await self._send_request('POST', endpoint, request_data)
         
-        if response_data.get('type') == MessageType.VERIFY_RESPONSE.value:
+        if response_data.get('type') == _MT_VERIFY_RESP:
             data = response_data['data']
             return VerifyResponse(**data)
         else:
@@ -200,7 +281,7 @@ class HTTPClient:
     async def send_inference_request(
         self, 
         inference_request: InferenceRequest,
-        endpoint: str = '/inference'
+        endpoint: str = _INFERENCE_URL
     ) -> InferenceResponse:
         """
         发送推理请求
@@ -212,7 +293,7 @@ class HTTPClient:
         Returns:
             推理响应
         """
-        request_data = inference_request.__dict__
+        request_data = inference_request
         
         response_data = await self._send_request('POST', endpoint, request_data)
         
@@ -228,10 +309,43 @@ class HTTPClient:
         else:
             raise ValueError(f"Invalid inference response: {response_data}")
     
+    async def stream_inference_request(
+        self,
+        inference_request: InferenceRequest,
+        endpoint: str = _INFERENCE_URL
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        发送流式推理请求，逐帧产出 (NDJSON)
+        
+        协同模式下先产出 inference_draft 帧 (边端草稿)，最后产出 inference_result 帧
+        (与 send_inference_request 的响应字段相同)；流式请求不做重试
+        
+        Args:
+            inference_request: 推理请求
+            endpoint: 端点
+        """
+        if not self.session:
+            await self.start()
+        
+        start_time = time.time()
+        body = dumps({**dataclasses.asdict(inference_request), 'stream': True})
+        
+        try:
+            async with self.session.post(endpoint, data=body, headers=_JSON_HEADERS) as response:
+                # StreamReader 按行迭代，每行一帧
+                async for line in response.content:
+                    if line.strip():
+                        yield loads(line)
+        except Exception:
+            self._update_stats(time.time() - start_time, success=False)
+            raise
+        
+        self._update_stats(time.time() - start_time, success=True)
+    
     async def send_batch_verify_requests(
         self, 
         verify_requests: List[VerifyRequest],
-        endpoint: str = '/verify/batch'
+        endpoint: str = _BATCH_VERIFY_URL
     ) -> List[VerifyResponse]:
         """
         发送批量验证请求
@@ -243,22 +357,23 @@ class HTTPClient:
         Returns:
             验证响应列表
         """
+        # 请求对象直接交给 codec 编码 (orjson 原生支持 dataclass)，不先构造字典列表
         request_data = {
-            'type': 'batch_verify_request',
+            'type': _MT_BATCH_VERIFY_REQ,
             'data': {
-                'requests': [req.__dict__ for req in verify_requests]
+                'requests': verify_requests
             }
         }
         
         response_data = await self._send_request('POST', endpoint, request_data)
         
-        if response_data.get('type') == 'batch_verify_response':
+        if response_data.get('type') == _MT_BATCH_VERIFY_RESP:
             results = response_data['data']['results']
             return [VerifyResponse(**result) for result in results]
         else:
             raise ValueError(f"Unexpected batch response: {response_data}")
     
-    async def health_check(self, endpoint: str = '/health') -> Dict[str, Any]:
+    async def health_check(self, endpoint: str = _HEALTH_URL) -> Dict[str, Any]:
         """
         健康检查
         
@@ -269,12 +384,12 @@ class HTTPClient:
             健康状态
         """
         request_data = {
-            'type': MessageType.HEALTH_CHECK.value
+            'type': _MT_HEALTH_CHECK
         }
         
         return await self._send_request('GET', endpoint, request_data)
     
-    async def get_cache_stats(self, endpoint: str = '/cache/stats') -> Dict[str, Any]:
+    async def get_cache_stats(self, endpoint: str = _CACHE_STATS_URL) -> Dict[str, Any]:
         """
         获取缓存统计
         
@@ -286,9 +401,47 @@ class HTTPClient:
         """
         return await self._send_request('GET', endpoint)
     
+    async def send_request(
+        self,
+        method: str,
+        endpoint: str,
+        data: Optional[Any] = None
+    ) -> Dict[str, Any]:
+        """
+        发送原始请求 (带重试)，返回解码后的响应字典
+        
+        用于没有专用 send_* 方法、或需要响应中全部字段的调用方
+        
+        Args:
+            method: HTTP 方法
+            endpoint: 端点
+            data: 请求体 (字典或 dataclass，由 codec 编码)
+            
+        Returns:
+            响应字典
+        """
+        return await self._send_request(method, endpoint, data)
+    
     def get_client_stats(self) -> Dict[str, Any]:
-        """获取客户端统计"""
-        return self.stats.copy()
+        """获取客户端统计 (延迟指标基于最近 LATENCY_WINDOW 次成功请求)"""
+        responses = self._counts[_N_SUCCESS]
+        errors = self._counts[_N_ERRORS]
+        stats = {
+            'requests_sent': responses + errors,
+            'responses_received': responses,
+            'errors': errors,
+            'avg_latency_ms': 0.0
+        }
+        
+        n = min(responses, LATENCY_WINDOW)
+        if n:
+            window = self._lat_ring[:n]
+            p50, p99 = np.percentile(window, [50, 99])
+            stats['avg_latency_ms'] = float(window.mean())
+            stats['p50_latency_ms'] = float(p50)
+            stats['p99_latency_ms'] = float(p99)
+        
+        return stats
 
 
 class EdgeCloudHTTPClient:
@@ -326,10 +479,13 @@ class EdgeCloudHTTPClient:
     
     async def edge_generate_draft(
         self, 
-        draft_request: DraftRequest
+        draft_request: DraftRequest,
+        decode_token_probs: bool = True
     ) -> DraftResponse:
         """边端生成 Draft"""
-        return await self.edge_client.send_draft_request(draft_request)
+        return await self.edge_client.send_draft_request(
+            draft_request, decode_token_probs=decode_token_probs
+        )
     
     async def cloud_verify_draft(
         self, 
@@ -371,7 +527,8 @@ class EdgeCloudHTTPClient:
             confidence_threshold=confidence_threshold
         )
         
-        draft_response = await self.edge_generate_draft(draft_request)
+        # 流程只用到置信度标量，不逐个还原 token_probs
+        draft_response = await self.edge_generate_draft(draft_request, decode_token_probs=False)
         
         # 2. 检查置信度
         if use_confidence_check:
@@ -423,11 +580,31 @@ class EdgeCloudHTTPClient:
 
 # 简单的同步封装
 class SimpleHTTPClient:
-    """简单的同步 HTTP 客户端"""
+    """
+    简单的同步 HTTP 客户端
+    
+    后台线程常驻一个事件循环并持有同一个 HTTPClient，连续的同步调用复用
+    同一个 ClientSession 的连接池 (不再每次新建事件循环、会话和 TCP 连接)
+    """
     
     def __init__(self, base_url: str):
         self.base_url = base_url
         
+        self.loop = uvloop.new_event_loop() if uvloop is not None else asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self.loop.run_forever, name='SimpleHTTPClient', daemon=True
+        )
+        self._thread.start()
+        
+        self.client = HTTPClient(base_url)
+        self._run(self.client.start())
+        
+        atexit.register(self.close)
+    
+    def _run(self, coro):
+        """在后台事件循环上执行协程并同步等待结果"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+    
     def send_request(
         self, 
         method: str,
@@ -435,12 +612,25 @@ class SimpleHTTPClient:
         data: Optional[Dict[str, Any]] = None
     ) -> Dict[str, Any]:
         """发送同步请求"""
-        async def _async_request():
-            async with HTTPClient(self.base_url) as client:
-                return await client._send_request(method, endpoint, data)
-        
-        return asyncio.run(_async_request())
+        return self._run(self.client.send_request(method, endpoint, data))
     
     def health_check(self, endpoint: str = '/health') -> Dict[str, Any]:
         """健康检查"""
         return self.send_request('GET', endpoint)
+    
+    def close(self):
+        """关闭会话并停止后台事件循环 (可重复调用)"""
+        if self.loop.is_closed():
+            return
+        
+        atexit.unregister(self.close)
+        self._run(self.client.stop())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
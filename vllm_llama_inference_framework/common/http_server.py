@@ -2,14 +2,47 @@
 F4: HTTP 服务器模块
 简单的 HTTP 服务器框架，用于边端和云端
 """
+import array
 import asyncio
-import json
+import logging
 from typing import Dict, Any, Callable, Awaitable, Optional, List
 from aiohttp import web, ClientSession
-import aiohttp_cors
 import time
 from functools import wraps
 
+from common.codec import json_response, loads
+from common.http_client import HTTPClient
+from common.queue_logging import setup_queue_logging
+from common.types import InferenceRequest
+
+
+# HTTP 日志: 经 common.queue_logging 的后台队列输出 (start() 时初始化)
+logger = logging.getLogger('http')
+
+# 请求计数数组的下标
+_N_SUCCESS = 0
+_N_ERRORS = 1
+
+
+# CORS 响应头 (允许任意来源，预先构造一次)
+_CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': '*',
+    'Access-Control-Allow-Headers': '*',
+    'Access-Control-Expose-Headers': '*',
+}
+
+
+@web.middleware
+async def cors_middleware(request: web.Request, handler):
+    """CORS 中间件: 直接应答预检请求，其余响应附加 CORS 头 (对所有路由生效，与注册顺序无关)"""
+    if request.method == 'OPTIONS':
+        return web.Response(headers=_CORS_HEADERS)
+    
+    response = await handler(request)
+    response.headers.update(_CORS_HEADERS)
+    return response
+
 
 def measure_latency(func):
     """测量函数执行时间的装饰器"""
@@ -45,12 +78,14 @@ class HTTPServer:
         host: str = 'localhost',
         port: int = 8080,
         enable_cors: bool = True,
-        enable_metrics: bool = True
+        enable_metrics: bool = True,
+        log_level: str = 'INFO'
     ):
         self.host = host
         self.port = port
         self.enable_cors = enable_cors
         self.enable_metrics = enable_metrics
+        self.log_level = log_level
         
         # Web 应用
         self.app = web.Application()
@@ -61,13 +96,8 @@ class HTTPServer:
         # 中间件
         self.middlewares: List[Callable] = []
         
-        # 统计
-        self.metrics = {
-            'requests_total': 0,
-            'requests_success': 0,
-            'requests_error': 0,
-            'avg_latency_ms': 0.0
-        }
+        # 统计: 热路径上只累加计数数组，get_metrics 时再汇总成字典
+        self._counts = array.array('Q', [0, 0])
         
         # 设置 CORS
         if enable_cors:
@@ -75,18 +105,7 @@ class HTTPServer:
     
     def _setup_cors(self):
         """设置 CORS"""
-        cors = aiohttp_cors.setup(self.app, defaults={
-            "*": aiohttp_cors.ResourceOptions(
-                allow_credentials=True,
-                expose_headers="*",
-                allow_headers="*",
-                allow_methods="*"
-            )
-        })
-        
-        # 为所有路由添加 CORS
-        for resource in list(self.app.router.resources()):
-            cors.add(resource)
+        self.app.middlewares.append(cors_middleware)
     
     def register_route(
         self, 
@@ -108,6 +127,13 @@ class HTTPServer:
         # 包装处理器
         async def wrapped_handler(request):
             try:
+                # 请求体只在这里读取并解析一次，日志/中间件/处理器共用 request['parsed']
+                if request.can_read_body:
+                    request['body'] = await request.read()
+                    request['parsed'] = loads(request['body'])
+                else:
+                    request['parsed'] = None
+                
                 # 记录请求
                 await self._log_request(request)
                 
@@ -123,11 +149,11 @@ class HTTPServer:
                 # 更新指标
                 self._update_metrics(success=True)
                 
-                return web.json_response(result)
+                return json_response(result)
             
             except Exception as e:
                 self._update_metrics(success=False)
-                return web.json_response(
+                return json_response(
                     {'error': str(e)}, 
                     status=500
                 )
@@ -140,38 +166,37 @@ class HTTPServer:
         self.middlewares.append(middleware)
     
     async def _log_request(self, request: web.Request):
-        """记录请求日志"""
-        print(f"[HTTP] {request.method} {request.path}")
-        
-        if request.can_read_body:
-            try:
-                body = await request.json()
-                print(f"[HTTP] 请求体: {json.dumps(body, indent=2)[:200]}...")
-            except:
-                pass
+        """记录请求日志 (只记录方法、路径和请求体长度，不读取/重新编码请求体)"""
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('%s %s (%s bytes)', request.method, request.path, request.content_length)
     
     def _update_metrics(self, success: bool):
         """更新指标"""
-        self.metrics['requests_total'] += 1
-        
-        if success:
-            self.metrics['requests_success'] += 1
-        else:
-            self.metrics['requests_error'] += 1
+        self._counts[_N_SUCCESS if success else _N_ERRORS] += 1
     
     def get_metrics(self) -> Dict[str, Any]:
         """获取服务器指标"""
-        return self.metrics.copy()
+        success = self._counts[_N_SUCCESS]
+        errors = self._counts[_N_ERRORS]
+        return {
+            'requests_total': success + errors,
+            'requests_success': success,
+            'requests_error': errors,
+            'avg_latency_ms': 0.0
+        }
     
     async def start(self):
         """启动服务器"""
+        setup_queue_logging(logger, self.log_level)
+        
         runner = web.AppRunner(self.app)
         await runner.setup()
         
-        site = web.TCPSite(runner, self.host, self.port)
+        # 并发连接突发时加大 accept 队列 (TCP_NODELAY 由 aiohttp 对每个连接默认开启)
+        site = web.TCPSite(runner, self.host, self.port, backlog=4096)
         await site.start()
         
-        print(f"[HTTP] HTTP 服务器运行在 http://{self.host}:{self.port}")
+        logger.info('HTTP 服务器运行在 http://%s:%s', self.host, self.port)
         
         return runner
 
@@ -192,13 +217,13 @@ class EdgeHTTPServer(HTTPServer):
         @measure_latency
         async def handle_draft(request):
             """处理 Draft 请求"""
-            data = await request.json()
+            data = request['parsed']
             return await self.edge_server.handle_draft_request(data)
         
         @measure_latency
         async def handle_inference(request):
             """处理推理请求"""
-            data = await request.json()
+            data = request['parsed']
             inference_request = InferenceRequest(**data)
             return await self.edge_server.process_inference(inference_request)
         
@@ -233,18 +258,18 @@ class CloudHTTPServer(HTTPServer):
         @measure_latency
         async def handle_verify(request):
             """处理验证请求"""
-            data = await request.json()
+            data = request['parsed']
             return await self.cloud_server.handle_verify_request(data)
         
         @measure_latency
         async def handle_batch_verify(request):
             """处理批量验证请求"""
-            data = await request.json()
+            data = request['parsed']
             return await self.cloud_server.handle_batch_verify(data)
         
         async def handle_direct_inference(request):
             """处理直接推理请求"""
-            data = await request.json()
+            data = request['parsed']
             return await self.cloud_server.handle_direct_inference(data)
         
         async def handle_health(request):
@@ -269,14 +294,14 @@ async def logging_middleware(request):
     start_time = time.time()
     
     # 记录请求
-    print(f"[Middleware] {request.method} {request.path} - 开始")
+    logger.debug('[Middleware] %s %s - 开始', request.method, request.path)
     
     # 继续处理
     response = None
     
     # 记录响应时间
     latency = (time.time() - start_time) * 1000
-    print(f"[Middleware] {request.method} {request.path} - 完成 ({latency:.2f}ms)")
+    logger.debug('[Middleware] %s %s - 完成 (%.2fms)', request.method, request.path, latency)
     
     return response
 
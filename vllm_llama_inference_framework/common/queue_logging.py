@@ -0,0 +1,64 @@
+"""
+队列日志: 请求路径只把日志记录放入有界队列，由后台线程负责格式化和写 stdout
+云端 ('cloud') 与 HTTP 服务器 ('http') 共用
+"""
+import logging
+import logging.handlers
+import queue
+import sys
+from typing import Dict
+
+
+# 队列上限: 后台线程跟不上时直接丢弃新日志，既不阻塞事件循环也不无限占用内存
+LOG_QUEUE_SIZE = 10000
+
+# 日志器名 -> 后台监听线程 (每个日志器只初始化一次)
+_listeners: Dict[str, logging.handlers.QueueListener] = {}
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """队列满时丢弃记录并计数 (默认 QueueHandler 会走 handleError 打印异常栈)"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_queue_logging(
+    logger: logging.Logger,
+    level: str = 'INFO',
+    maxsize: int = LOG_QUEUE_SIZE
+) -> logging.handlers.QueueListener:
+    """为 logger 挂上有界 QueueHandler -> QueueListener (只初始化一次，重复调用只更新级别)"""
+    logger.setLevel(getattr(logging, str(level).upper(), logging.INFO))
+
+    listener = _listeners.get(logger.name)
+    if listener is None:
+        log_queue: queue.Queue = queue.Queue(maxsize)
+        stream_handler = logging.StreamHandler(sys.stdout)
+        stream_handler.setFormatter(logging.Formatter('[%(name)s] %(message)s'))
+
+        listener = logging.handlers.QueueListener(log_queue, stream_handler)
+        listener.start()
+        _listeners[logger.name] = listener
+
+        logger.addHandler(DroppingQueueHandler(log_queue))
+        logger.propagate = False
+
+    return listener
+
+
+def shutdown_queue_logging(logger: logging.Logger):
+    """停止 logger 的后台日志线程 (会先刷出队列中剩余的日志)"""
+    listener = _listeners.pop(logger.name, None)
+    if listener is not None:
+        listener.stop()
+        for handler in list(logger.handlers):
+            if isinstance(handler, DroppingQueueHandler):
+                logger.removeHandler(handler)
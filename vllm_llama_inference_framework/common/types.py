@@ -2,10 +2,21 @@
 公共数据类型定义 - 最终完整版
 整合了 F1 决策、F2 协同、F3 缓存、F4 通信的所有数据结构
 """
+import sys
 from typing import List, Dict, Any, Optional, Union
 from dataclasses import dataclass, field
 from enum import Enum
 
+# 高频收发的消息类型使用 __slots__ (Python 3.10+): 实例无 __dict__，构造更快、内存更省
+# 旧版本 Python 退化为普通 dataclass；序列化请使用 dataclasses.asdict / common.codec
+# frozen_slotted_dataclass 用于可在多个消息间共享的只读类型 (赋值字段会抛 FrozenInstanceError)
+if sys.version_info >= (3, 10):
+    slotted_dataclass = dataclass(slots=True)
+    frozen_slotted_dataclass = dataclass(slots=True, frozen=True)
+else:
+    slotted_dataclass = dataclass
+    frozen_slotted_dataclass = dataclass(frozen=True)
+
 # ==================== 1. 枚举定义 ====================
 
 class ConfidenceStrategy(Enum):
@@ -21,6 +32,10 @@ class MessageType(Enum):
     DRAFT_RESPONSE = "draft_response"
     VERIFY_REQUEST = "verify_request"
     VERIFY_RESPONSE = "verify_response"
+    OPTIMISTIC_ACCEPT = "optimistic_accept"  # 流式验证的乐观接受帧 (先于真实验证结果)
+    PREFETCH_REQUEST = "prefetch_request"    # 边端起草前通知云端提前生成标准答案
+    INFERENCE_DRAFT = "inference_draft"      # 流式推理的草稿帧 (起草完成即发出，先于验证结果)
+    INFERENCE_RESULT = "inference_result"    # 流式推理的最终结果帧
     HEALTH_CHECK = "health_check"
     DIRECT_INFERENCE = "direct_inference"
 
@@ -33,7 +48,7 @@ class ExecutionStrategy(Enum):
 
 # ==================== 2. 基础数据结构 ====================
 
-@dataclass
+@slotted_dataclass
 class TokenProb:
     """Token 概率信息"""
     token_id: int
@@ -41,7 +56,7 @@ class TokenProb:
     prob: float
     logprob: float
 
-@dataclass
+@slotted_dataclass
 class ConfidenceMetrics:
     """置信度指标"""
     confidence_score: float
@@ -52,9 +67,9 @@ class ConfidenceMetrics:
     min_prob: float = 0.0
     avg_prob: float = 0.0
 
-@dataclass
+@frozen_slotted_dataclass
 class KVCacheInfo:
-    """KV Cache 统计信息"""
+    """KV Cache 统计信息 (不可变，相同统计的实例可在多个响应间共享)"""
     cache_size: int = 0
     hit_tokens: int = 0
     miss_tokens: int = 0
@@ -63,7 +78,7 @@ class KVCacheInfo:
 
 # ==================== 3. 任务与状态定义 (F1 核心) ====================
 
-@dataclass
+@slotted_dataclass
 class TaskRequirements:
     """任务需求 (SLO)"""
     max_latency_ms: int = 5000        # 最大容忍延迟
@@ -71,7 +86,7 @@ class TaskRequirements:
     priority: int = 1                 # 优先级 (1-5, 5最高)
     privacy_level: int = 0            # 隐私等级 (0:公开, 1:敏感, 2:机密)
 
-@dataclass
+@slotted_dataclass
 class SystemStats:
     """系统硬件状态（扩展：支持GPU监控）"""
     cpu_usage: float
@@ -81,7 +96,7 @@ class SystemStats:
     device_type: str = "cpu"  # 新增：设备类型（"cpu" 或 "gpu"）
     timestamp: float = 0.0
 
-@dataclass
+@slotted_dataclass
 class NetworkStats:
     """网络状态（阶段2新增）"""
     rtt_ms: float  # 往返延迟
@@ -91,7 +106,7 @@ class NetworkStats:
 
 # ==================== 4. 请求与响应定义 ====================
 
-@dataclass
+@slotted_dataclass
 class InferenceRequest:
     """推理请求 (客户端 -> Edge)"""
     prompt: str
@@ -110,7 +125,7 @@ class InferenceRequest:
     # 任务需求 (F1)
     requirements: TaskRequirements = field(default_factory=TaskRequirements)
 
-@dataclass
+@slotted_dataclass
 class DraftRequest:
     """Draft 生成请求 (Edge 内部 或 Edge -> Mock)"""
     prompt: str
@@ -120,24 +135,26 @@ class DraftRequest:
     top_k: int = 40
     confidence_threshold: float = 0.8
 
-@dataclass
+@slotted_dataclass
 class DraftResponse:
     """Draft 生成响应"""
     draft_tokens: List[str]
     draft_token_ids: List[int]
     confidence: ConfidenceMetrics
-    kv_cache_info: Dict[str, Any]
+    kv_cache_info: KVCacheInfo
     latency_ms: float
 
-@dataclass
+@slotted_dataclass
 class VerifyRequest:
     """验证请求 (Edge -> Cloud)"""
     prompt: str
     draft_tokens: List[str]
     draft_token_ids: List[int]
     confidence_threshold: float = 0.8
+    return_final_text: bool = True  # False 时云端不拼接 final_text，由调用方自行用 verified_tokens 还原
+    prompt_token_ids: Optional[List[int]] = None  # 云端分词器下的 prompt token ID (已知时可跳过云端分词)
 
-@dataclass
+@slotted_dataclass
 class VerifyResponse:
     """验证响应 (Cloud -> Edge)"""
     verified_tokens: List[str]
@@ -146,12 +163,13 @@ class VerifyResponse:
     total_count: int
     acceptance_rate: float
     corrected_positions: List[int]
-    final_text: str
+    final_text: Optional[str] = None  # 仅在 VerifyRequest.return_final_text 为 True 时填充
     latency_ms: float = 0.0
+    rollback_from: Optional[int] = None  # 首个被拒位置 (draft 字符偏移)，乐观起草的内容需从此处丢弃
 
 # ==================== 5. 决策模块定义 (F1) ====================
 
-@dataclass
+@slotted_dataclass
 class DecisionContext:
     """决策上下文（阶段2扩展：加入网络状态）"""
     request: InferenceRequest
@@ -159,7 +177,7 @@ class DecisionContext:
     task_requirements: TaskRequirements
     network_state: Optional['NetworkStats'] = None  # 阶段2新增
 
-@dataclass
+@slotted_dataclass
 class ExecutionPlan:
     """执行计划"""
     strategy: ExecutionStrategy
@@ -169,13 +187,13 @@ class ExecutionPlan:
     reason: str = ""
     score: float = 0.0
 
-@dataclass
+@slotted_dataclass
 class HardDecision:
     """硬约束结果"""
     strategy: ExecutionStrategy
     reason: str
 
-@dataclass
+@slotted_dataclass
 class ScoredStrategy:
     """策略评分"""
     strategy: ExecutionStrategy
@@ -183,7 +201,7 @@ class ScoredStrategy:
 
 # ==================== 6. 最终响应定义 (F4) ====================
 
-@dataclass
+@slotted_dataclass
 class InferenceResponse:
     """推理响应结果 (用于 HTTP 客户端解析)"""
     text: str
@@ -3,7 +3,7 @@
 基于历史统计动态调整决策参数
 """
 from typing import Dict, Optional
-from edge.history_tracker import HistoryTracker
+from edge.history_tracker import HistoryTracker, WindowStats
 from common.types import ExecutionStrategy
 
 
@@ -44,6 +44,8 @@ class AdaptiveThresholdCalculator:
         # 更新计数器（每 N 次执行更新一次参数）
         self.update_interval = config.get('update_interval', 10)
         self._execution_count = 0
+        # 距下次更新还剩的执行次数 (倒计时归零即更新，任意间隔都不需要取模)
+        self._until_update = self.update_interval
     
     def should_update(self) -> bool:
         """
@@ -53,11 +55,22 @@ class AdaptiveThresholdCalculator:
             是否到达更新时机
         """
         self._execution_count += 1
-        return self._execution_count % self.update_interval == 0
+        self._until_update -= 1
+        if self._until_update:
+            return False
+        
+        self._until_update = self.update_interval
+        return True
+    
+    @staticmethod
+    def _speculative_window(history: HistoryTracker) -> WindowStats:
+        """SPECULATIVE 策略最近 20 次的样本数、平均接受率和平均延迟"""
+        return history.get_recent_window(ExecutionStrategy.SPECULATIVE_STANDARD, n=20)
     
     def calculate_adaptive_confidence_threshold(self,
                                                  history: HistoryTracker,
-                                                 current_threshold: float) -> float:
+                                                 current_threshold: float,
+                                                 window: Optional[WindowStats] = None) -> float:
         """
         计算自适应置信度阈值
         
@@ -70,20 +83,21 @@ class AdaptiveThresholdCalculator:
         Args:
             history: 历史追踪器
             current_threshold: 当前阈值
+            window: 预先取好的 SPECULATIVE 近期窗口 (None 时从 history 读取)
         
         Returns:
             新的置信度阈值
         """
-        # 获取最近的接受率
-        recent_ar = history.get_recent_acceptance_rate(
-            strategy=ExecutionStrategy.SPECULATIVE_STANDARD,
-            n=20
-        )
+        # 获取最近的接受率 (样本数与均值来自同一个增量维护的窗口，不扫描历史)
+        if window is None:
+            window = self._speculative_window(history)
         
         # 如果样本不足，保持当前值
-        if len(history.get_records_by_strategy(ExecutionStrategy.SPECULATIVE_STANDARD, n=20)) < 5:
+        if window.count < 5:
             return current_threshold
         
+        recent_ar = window.mean_acceptance
+        
         # 计算调整量
         adjustment = 0.0
         
@@ -121,7 +135,8 @@ class AdaptiveThresholdCalculator:
     def calculate_adaptive_draft_length(self,
                                          history: HistoryTracker,
                                          current_length: int,
-                                         task_latency_requirement: int) -> int:
+                                         task_latency_requirement: int,
+                                         window: Optional[WindowStats] = None) -> int:
         """
         计算自适应 Draft 长度
         
@@ -133,15 +148,15 @@ class AdaptiveThresholdCalculator:
             history: 历史追踪器
             current_length: 当前 draft 长度
             task_latency_requirement: 任务延迟要求 (ms)
+            window: 预先取好的 SPECULATIVE 近期窗口 (None 时从 history 读取)
         
         Returns:
             新的 draft 长度
         """
         # 获取最近的平均延迟
-        recent_latency = history.get_avg_latency(
-            strategy=ExecutionStrategy.SPECULATIVE_STANDARD,
-            n=20
-        )
+        if window is None:
+            window = self._speculative_window(history)
+        recent_latency = window.mean_latency
         
         # 计算延迟余量
         latency_margin = task_latency_requirement - recent_latency
@@ -192,11 +207,15 @@ class AdaptiveThresholdCalculator:
         """
         new_params = current_params.copy()
         
+        # 阈值与 draft 长度共用同一份近期窗口汇总，只读取一次
+        window = self._speculative_window(history)
+        
         # 更新置信度阈值
         if 'confidence_threshold' in current_params:
             new_params['confidence_threshold'] = self.calculate_adaptive_confidence_threshold(
                 history,
-                current_params['confidence_threshold']
+                current_params['confidence_threshold'],
+                window
             )
             # 缓存当前值
             self.current_confidence_threshold = new_params['confidence_threshold']
@@ -206,7 +225,8 @@ class AdaptiveThresholdCalculator:
             new_params['draft_max_tokens'] = self.calculate_adaptive_draft_length(
                 history,
                 current_params['draft_max_tokens'],
-                current_params['task_latency_slo']
+                current_params['task_latency_slo'],
+                window
             )
         
         # 更新权重
@@ -2,11 +2,17 @@
 F1: 置信度判断逻辑
 支持多种置信度计算策略，模块化设计便于消融实验
 """
-import math
 # ==================== 修改点: 补全 Dict, Any, Optional ====================
-from typing import List, Tuple, Dict, Any, Optional
+from typing import List, Tuple, Dict, Any, Optional, NamedTuple
 # ========================================================================
 import numpy as np
+
+# numba 可选: 存在时把统计量计算编译为单个循环内核，否则使用 NumPy 向量化实现
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
 from common.types import (
     TokenProb, 
     ConfidenceMetrics, 
@@ -14,13 +20,81 @@ from common.types import (
 )
 
 
+class _ConfidenceContext(NamedTuple):
+    """一次置信度计算共用的中间结果 (概率/对数概率数组与基本统计量)，各策略直接读取"""
+    token_probs: List[TokenProb]
+    probs: np.ndarray
+    logprobs: np.ndarray
+    max_prob: float
+    min_prob: float
+    avg_prob: float
+    entropy: float
+
+
+def _confidence_stats(probs: np.ndarray) -> Tuple[float, float, float, float]:
+    """单次遍历计算 (max, min, mean, entropy)；numba 可用时编译执行"""
+    max_p = probs[0]
+    min_p = probs[0]
+    total = 0.0
+    entropy = 0.0
+    for p in probs:
+        if p > max_p:
+            max_p = p
+        if p < min_p:
+            min_p = p
+        total += p
+        # p=0 的项为 0，与逐项 `if p > 0` 求和一致
+        entropy -= p * np.log(p + 1e-10)
+    return max_p, min_p, total / probs.size, entropy
+
+
+_confidence_stats_kernel = njit(cache=True)(_confidence_stats) if njit is not None else None
+
+
+def _build_context(token_probs: List[TokenProb]) -> _ConfidenceContext:
+    """对非空 token_probs 一次性取出数组并计算统计量"""
+    n = len(token_probs)
+    probs = np.fromiter((tp.prob for tp in token_probs), dtype=np.float64, count=n)
+    logprobs = np.fromiter((tp.logprob for tp in token_probs), dtype=np.float64, count=n)
+    
+    if _confidence_stats_kernel is not None:
+        max_prob, min_prob, avg_prob, entropy = _confidence_stats_kernel(probs)
+    else:
+        # 熵: 加偏移后原地取对数 (只分配一个临时数组)，再与概率做一次点积；
+        # p=0 的项为 0，与逐项 `if p > 0` 求和一致，无需分支
+        log_p = probs + 1e-10
+        np.log(log_p, out=log_p)
+        max_prob, min_prob, avg_prob = probs.max(), probs.min(), probs.mean()
+        entropy = -np.dot(probs, log_p)
+    
+    return _ConfidenceContext(
+        token_probs=token_probs,
+        probs=probs,
+        logprobs=logprobs,
+        max_prob=float(max_prob),
+        min_prob=float(min_prob),
+        avg_prob=float(avg_prob),
+        entropy=float(entropy)
+    )
+
+
 class ConfidenceCalculator:
     """置信度计算器"""
     
-    def __init__(self, strategy: ConfidenceStrategy = ConfidenceStrategy.MAX_PROB):
+    def __init__(
+        self,
+        strategy: ConfidenceStrategy = ConfidenceStrategy.MAX_PROB,
+        top_k: int = 5
+    ):
         self.strategy = strategy
         self.temperature = 1.0
         
+        # Top-K 聚合的递减权重 1/(i+1)：归一化后的完整权重，以及 token 数不足 K 时用的前缀和
+        self.top_k = top_k
+        self._topk_weights = 1.0 / np.arange(1, top_k + 1)
+        self._topk_weight_sums = np.cumsum(self._topk_weights)
+        self._topk_weights_norm = self._topk_weights / self._topk_weight_sums[-1]
+        
     def calculate_confidence(self, token_probs: List[TokenProb]) -> ConfidenceMetrics:
         """
         计算置信度指标
@@ -42,110 +116,78 @@ class ConfidenceCalculator:
                 avg_prob=0.0
             )
         
-        # 提取概率值
-        probs = [tp.prob for tp in token_probs]
-        # logprobs = [tp.logprob for tp in token_probs] # 暂时未使用
-        
-        # 计算基本统计
-        max_prob = max(probs)
-        min_prob = min(probs)
-        avg_prob = np.mean(probs)
-        
-        # 计算熵值
-        entropy = -sum(p * math.log(p + 1e-10) for p in probs if p > 0)
-        
-        # 根据策略计算置信度分数
-        confidence_score = self._calculate_by_strategy(
-            token_probs, max_prob, entropy
-        )
-        
+        return self._metrics_from_context(_build_context(token_probs))
+    
+    def _metrics_from_context(self, ctx: _ConfidenceContext) -> ConfidenceMetrics:
+        """由预先计算的上下文生成置信度指标"""
         return ConfidenceMetrics(
-            confidence_score=confidence_score,
+            confidence_score=self._calculate_by_strategy(ctx),
             strategy=self.strategy,
-            token_probs=token_probs,
-            entropy=entropy,
-            max_prob=max_prob,
-            min_prob=min_prob,
-            avg_prob=avg_prob
+            token_probs=ctx.token_probs,
+            entropy=ctx.entropy,
+            max_prob=ctx.max_prob,
+            min_prob=ctx.min_prob,
+            avg_prob=ctx.avg_prob
         )
     
-    def _calculate_by_strategy(
-        self, 
-        token_probs: List[TokenProb], 
-        max_prob: float, 
-        entropy: float
-    ) -> float:
+    def _calculate_by_strategy(self, ctx: _ConfidenceContext) -> float:
         """根据策略计算置信度分数"""
         if self.strategy == ConfidenceStrategy.MAX_PROB:
-            return self._max_prob_strategy(token_probs)
+            return self._max_prob_strategy(ctx)
         elif self.strategy == ConfidenceStrategy.ENTROPY:
-            return self._entropy_strategy(token_probs, entropy)
+            return self._entropy_strategy(ctx)
         elif self.strategy == ConfidenceStrategy.TEMPERATURE:
-            return self._temperature_strategy(token_probs)
+            return self._temperature_strategy(ctx)
         elif self.strategy == ConfidenceStrategy.TOP_K_AGG:
-            return self._top_k_agg_strategy(token_probs)
+            return self._top_k_agg_strategy(ctx)
         else:
-            return max_prob
+            return ctx.max_prob
     
-    def _max_prob_strategy(self, token_probs: List[TokenProb]) -> float:
+    def _max_prob_strategy(self, ctx: _ConfidenceContext) -> float:
         """
         最大概率策略：取所有token最大概率的平均值
         """
-        max_probs = [tp.prob for tp in token_probs]
-        return np.mean(max_probs) if max_probs else 0.0
+        return ctx.avg_prob
     
-    def _entropy_strategy(
-        self, 
-        token_probs: List[TokenProb], 
-        entropy: float
-    ) -> float:
+    def _entropy_strategy(self, ctx: _ConfidenceContext) -> float:
         """
         熵值策略：熵越低，置信度越高
         归一化后取 (1 - normalized_entropy)
         """
         # 归一化熵值 (假设最大熵为 log(词汇表大小)，这里简化为10)
         max_entropy = 10.0
-        normalized_entropy = min(entropy / max_entropy, 1.0)
+        normalized_entropy = min(ctx.entropy / max_entropy, 1.0)
         return 1.0 - normalized_entropy
     
-    def _temperature_strategy(self, token_probs: List[TokenProb]) -> float:
+    def _temperature_strategy(self, ctx: _ConfidenceContext) -> float:
         """
         温度缩放策略：使用温度参数调整概率分布
         """
-        logprobs = np.array([tp.logprob for tp in token_probs])
+        # 应用温度缩放 (默认温度 1.0 时跳过逐元素除法)
+        scaled_logits = ctx.logprobs if self.temperature == 1.0 else ctx.logprobs / self.temperature
         
-        # 应用温度缩放
-        scaled_logits = logprobs / self.temperature
-        
-        # Softmax
-        exp_logits = np.exp(scaled_logits - np.max(scaled_logits))
-        softmax_probs = exp_logits / np.sum(exp_logits)
+        # Softmax 的最大值就是 exp(0) / sum(exp(x - max))，无需归一化整个数组再取 max
+        exp_sum = np.exp(scaled_logits - scaled_logits.max()).sum()
         
         # 取最大概率作为置信度
-        return float(np.max(softmax_probs))
+        return float(1.0 / exp_sum)
     
-    def _top_k_agg_strategy(
-        self, 
-        token_probs: List[TokenProb], 
-        k: int = 5
-    ) -> float:
+    def _top_k_agg_strategy(self, ctx: _ConfidenceContext) -> float:
         """
         Top-K 聚合策略：取Top-K概率的加权平均
         """
-        all_probs = []
-        for tp in token_probs:
-            # 这里简化处理，实际应从完整的概率分布中取Top-K
-            all_probs.append(tp.prob)
+        # 这里简化处理，实际应从完整的概率分布中取Top-K
+        k = self.top_k
+        probs = ctx.probs
+        if probs.size > k:
+            # O(N) 选出最大的 k 个，只对这 k 个排序
+            probs = np.partition(probs, probs.size - k)[-k:]
+        top_k = np.sort(probs)[::-1]
         
-        # 取Top-K并加权平均
-        top_k = sorted(all_probs, reverse=True)[:k]
-        weights = [1.0 / (i + 1) for i in range(len(top_k))]  # 递减权重
-        
-        if sum(weights) == 0:
-            return 0.0
-            
-        weighted_avg = sum(w * p for w, p in zip(weights, top_k)) / sum(weights)
-        return weighted_avg
+        n = top_k.size
+        if n == k:
+            return float(np.dot(self._topk_weights_norm, top_k))
+        return float(np.dot(self._topk_weights[:n], top_k) / self._topk_weight_sums[n - 1])
     
     def should_accept_draft(
         self, 
@@ -208,21 +250,23 @@ class ConfidenceEnsemble:
         Returns:
             (ensemble_score, individual_scores)
         """
-        if weights is None:
-            weights = [1.0] * len(self.calculators)
+        n = len(self.calculators)
+        w = np.ones(n) if weights is None else np.asarray(weights[:n], dtype=np.float64)
         
-        individual_scores = {}
-        weighted_sum = 0.0
-        weight_sum = 0.0
+        # 数组与统计量只计算一次，各策略共用
+        ctx = _build_context(token_probs) if token_probs else None
         
-        for i, (strategy, calculator) in enumerate(self.calculators.items()):
-            metrics = calculator.calculate_confidence(token_probs)
-            individual_scores[strategy.value] = metrics.confidence_score
-            weighted_sum += weights[i] * metrics.confidence_score
-            weight_sum += weights[i]
+        individual_scores = {
+            strategy.value: calculator._calculate_by_strategy(ctx) if ctx is not None else 0.0
+            for strategy, calculator in self.calculators.items()
+        }
         
-        ensemble_score = weighted_sum / weight_sum if weight_sum > 0 else 0.0
-        return ensemble_score, individual_scores
+        # 加权平均
+        weight_sum = w.sum()
+        if weight_sum <= 0:
+            return 0.0, individual_scores
+        scores = np.fromiter(individual_scores.values(), dtype=np.float64, count=n)
+        return float(np.dot(w, scores) / weight_sum), individual_scores
 
 
 # 消融实验支持
@@ -239,14 +283,14 @@ class AblatedConfidenceCalculator(ConfidenceCalculator):
         self.disable_entropy = disable_entropy
         self.disable_normalization = disable_normalization
     
-    def _entropy_strategy(self, token_probs: List[TokenProb], entropy: float) -> float:
+    def _entropy_strategy(self, ctx: _ConfidenceContext) -> float:
         """重写熵策略以支持消融"""
         if self.disable_entropy:
             # 禁用熵计算，返回基础置信度
-            return super()._max_prob_strategy(token_probs)
+            return super()._max_prob_strategy(ctx)
         
         if self.disable_normalization:
             # 禁用归一化，使用原始熵值
-            return max(0.0, 1.0 - entropy / 100.0)  # 简单归一化
+            return max(0.0, 1.0 - ctx.entropy / 100.0)  # 简单归一化
         
-        return super()._entropy_strategy(token_probs, entropy)
\ No newline at end of file
+        return super()._entropy_strategy(ctx)
\ No newline at end of file
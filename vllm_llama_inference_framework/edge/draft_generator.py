@@ -2,7 +2,6 @@
 边端 Draft 生成器 (修复版: 开启 logits_all 支持置信度计算)
 """
 import time
-import math
 import asyncio
 from typing import List, Tuple, Optional, Dict, Any
 import numpy as np
@@ -24,6 +23,10 @@ from common.types import (
 from edge.confidence import ConfidenceCalculator
 
 
+# KV Cache 由 llama.cpp 内部管理，每次响应的统计信息相同: KVCacheInfo 不可变，共享一个实例即可
+_LLAMA_CPP_KV_CACHE_INFO = KVCacheInfo(info='managed_by_llama_cpp')
+
+
 class DraftGenerator:
     """Draft 生成器（基于 llama.cpp 接口）"""
     
@@ -71,7 +74,7 @@ class DraftGenerator:
         request: DraftRequest
     ) -> DraftResponse:
         """生成 Draft tokens"""
-        start_time = time.time()
+        start_time = time.perf_counter()
         
         loop = asyncio.get_running_loop()
         
@@ -110,19 +113,20 @@ class DraftGenerator:
                     raw_tokens = logprobs_data.get('tokens', [])
                     token_logprobs = logprobs_data.get('token_logprobs', [])
                     
-                    for i, t in enumerate(raw_tokens):
-                        lp = token_logprobs[i] if i < len(token_logprobs) else -1.0
-                        prob = math.exp(lp) if lp is not None else 0.0
-                        
-                        tokens.append(t)
-                        token_ids.append(hash(t) % 10000) # 简化处理 ID
-                        
-                        token_probs_list.append(TokenProb(
-                            token_id=hash(t) % 10000,
-                            token=t,
-                            prob=prob,
-                            logprob=lp or -99.9
-                        ))
+                    # 一次性把整段 logprob 转成概率 (缺失补 -1.0，None 记为 NaN -> 概率 0)
+                    lps = [
+                        token_logprobs[i] if i < len(token_logprobs) else -1.0
+                        for i in range(len(raw_tokens))
+                    ]
+                    lp_arr = np.array([np.nan if lp is None else lp for lp in lps], dtype=np.float64)
+                    probs = np.nan_to_num(np.exp(lp_arr), nan=0.0).tolist()
+                    
+                    tokens = list(raw_tokens)
+                    token_ids = [hash(t) % 10000 for t in tokens] # 简化处理 ID
+                    token_probs_list = [
+                        TokenProb(token_id=tid, token=t, prob=prob, logprob=lp or -99.9)
+                        for t, tid, prob, lp in zip(tokens, token_ids, probs, lps)
+                    ]
                 else:
                     tokens = [text]
                     token_ids = [0]
@@ -138,18 +142,13 @@ class DraftGenerator:
             token_probs
         )
         
-        latency = (time.time() - start_time) * 1000
-        
-        kv_cache_info = {
-            'hit_rate': 0.0,
-            'info': 'managed_by_llama_cpp'
-        }
+        latency = (time.perf_counter() - start_time) * 1000
         
         return DraftResponse(
             draft_tokens=tokens,
             draft_token_ids=token_ids,
             confidence=confidence_metrics,
-            kv_cache_info=kv_cache_info,
+            kv_cache_info=_LLAMA_CPP_KV_CACHE_INFO,
             latency_ms=latency
         )
 
@@ -3,7 +3,7 @@
 """
 import asyncio
 import json
-from typing import Dict, Any, Optional, List, Tuple
+from typing import Dict, Any, Optional, List, Set, Tuple, Callable, Awaitable
 import aiohttp
 from aiohttp import web
 
@@ -15,6 +15,7 @@ from common.types import (
     ExecutionStrategy,
     TaskRequirements  # <--- [新增] 必须导入这个类
 )
+from common.codec import dumps, json_response, read_json
 from edge.draft_generator import DraftGenerator
 from edge.confidence import ConfidenceCalculator
 from edge.kv_cache import LlamaCppKVCache
@@ -78,12 +79,16 @@ class EdgeServer:
         self.f1_decision = F1_DecisionModule(f1_config)
         
         self.session: Optional[aiohttp.ClientSession] = None
+        # 进行中的预取请求 (保持引用，避免任务在完成前被回收)
+        self._prefetch_tasks: Set[asyncio.Task] = set()
     
     async def start(self):
         self.session = aiohttp.ClientSession()
         print(f"[Edge] 边端服务器组件已初始化")
     
     async def stop(self):
+        for task in self._prefetch_tasks:
+            task.cancel()
         if self.session:
             await self.session.close()
     
@@ -96,7 +101,7 @@ class EdgeServer:
             draft_response = await self.draft_generator.generate_draft(draft_request)
             return {
                 'type': MessageType.DRAFT_RESPONSE.value,
-                'data': draft_response.__dict__
+                'data': draft_response
             }
         except Exception as e:
             print(f"[Edge] Draft 生成错误: {e}")
@@ -113,8 +118,14 @@ class EdgeServer:
     
     async def process_inference(
         self, 
-        inference_request: InferenceRequest
+        inference_request: InferenceRequest,
+        on_draft: Optional[Callable[[DraftResponse], Awaitable[None]]] = None
     ) -> Dict[str, Any]:
+        """
+        执行一次推理
+        
+        on_draft: 协同模式下起草完成、发起验证之前的回调 (流式接口用它提前推送草稿)
+        """
         start_time = asyncio.get_event_loop().time()
         
         execution_plan = self.f1_decision.decide(inference_request)
@@ -125,9 +136,9 @@ class EdgeServer:
         elif execution_plan.strategy == ExecutionStrategy.CLOUD_DIRECT:
             result = await self._execute_cloud_direct(inference_request, execution_plan)
         elif execution_plan.strategy == ExecutionStrategy.SPECULATIVE_STANDARD:
-            result = await self._execute_speculative(inference_request, execution_plan)
+            result = await self._execute_speculative(inference_request, execution_plan, on_draft)
         elif execution_plan.strategy == ExecutionStrategy.ADAPTIVE_CONFIDENCE:
-            result = await self._execute_adaptive(inference_request, execution_plan)
+            result = await self._execute_adaptive(inference_request, execution_plan, on_draft)
         else:
             print(f"[Edge] 警告: 未知策略 {execution_plan.strategy}, 降级到 EDGE_ONLY")
             result = await self._execute_edge_only(inference_request, execution_plan)
@@ -146,7 +157,7 @@ class EdgeServer:
                 cloud_latency_ms=result.get('cloud_latency_ms', 0.0),
                 confidence_score=result.get('confidence_score', 0.0),
                 success=True,  # 成功完成
-                tokens_generated=len(result.get('tokens', []))
+                tokens_generated=result.get('num_tokens', len(result.get('tokens', ())))
             )
         except Exception as e:
             # 记录失败不应影响主流程
@@ -195,9 +206,10 @@ class EdgeServer:
                 if resp.status == 200:
                     cloud_result = await resp.json()
                     data = cloud_result.get('data', {})
+                    # 云端不回传 token 列表，只回传生成的 token 数
                     return {
                         'text': data.get('text', ''),
-                        'tokens': data.get('tokens', []),
+                        'num_tokens': data.get('num_tokens', 0),
                         'confidence_score': 1.0,
                         'used_draft_verify': False,
                         'edge_latency_ms': 0.0,
@@ -210,14 +222,24 @@ class EdgeServer:
             print(f"[Edge] 云端直接推理失败: {e}, 降级到边端")
             return await self._execute_edge_only(request, plan)
     
-    async def _execute_speculative(self, request, plan) -> Dict[str, Any]:
+    async def _execute_speculative(self, request, plan, on_draft=None) -> Dict[str, Any]:
         draft_request = DraftRequest(
             prompt=request.prompt,
             max_tokens=plan.draft_max_tokens,
             temperature=request.temperature,
             confidence_threshold=plan.confidence_threshold
         )
+        
+        # 起草的同时让云端开始生成标准答案 (可选，默认关闭)
+        # 只发出不等待: 预取不保证先于验证到达，未命中时云端会自行生成，不应占用关键路径
+        if self.edge_config.get('prefetch_ground_truth', False):
+            task = asyncio.create_task(self._prefetch_ground_truth(request, plan))
+            self._prefetch_tasks.add(task)
+            task.add_done_callback(self._prefetch_tasks.discard)
+        
         draft_response = await self.draft_generator.generate_draft(draft_request)
+        if on_draft is not None:
+            await on_draft(draft_response)
         
         try:
             if not self.session:
@@ -229,7 +251,9 @@ class EdgeServer:
                     'prompt': request.prompt,
                     'draft_tokens': draft_response.draft_tokens,
                     'draft_token_ids': draft_response.draft_token_ids,
-                    'confidence_threshold': plan.confidence_threshold
+                    'confidence_threshold': plan.confidence_threshold,
+                    # 不让云端回传带 prompt 的全量文本，本地用 verified_tokens 拼接
+                    'return_final_text': False
                 }
             }
             
@@ -242,8 +266,11 @@ class EdgeServer:
                 
                 if verify_response.get('type') == MessageType.VERIFY_RESPONSE.value:
                     verify_data = verify_response['data']
+                    final_text = verify_data.get('final_text')
+                    if final_text is None:
+                        final_text = request.prompt + ''.join(verify_data['verified_tokens'])
                     return {
-                        'text': verify_data['final_text'],
+                        'text': final_text,
                         'tokens': verify_data['verified_tokens'],
                         'confidence_score': draft_response.confidence.confidence_score,
                         'acceptance_rate': verify_data['acceptance_rate'],
@@ -263,14 +290,37 @@ class EdgeServer:
                 'cloud_latency_ms': 0.0
             }
     
-    async def _execute_adaptive(self, request, plan) -> Dict[str, Any]:
-        return await self._execute_speculative(request, plan)
+    async def _prefetch_ground_truth(self, request, plan) -> None:
+        """通知云端预取标准答案 (失败不影响主流程，验证时云端会自行生成)"""
+        try:
+            if not self.session:
+                self.session = aiohttp.ClientSession()
+            
+            prefetch_request = {
+                'type': MessageType.PREFETCH_REQUEST.value,
+                'data': {
+                    'prompt': request.prompt,
+                    'max_tokens': plan.draft_max_tokens
+                }
+            }
+            
+            async with self.session.post(
+                f"{self.cloud_endpoint}/verify/prefetch",
+                json=prefetch_request,
+                timeout=aiohttp.ClientTimeout(total=1.0)
+            ) as resp:
+                await resp.read()
+        except Exception as e:
+            print(f"[Edge] 预取请求失败: {e}")
+    
+    async def _execute_adaptive(self, request, plan, on_draft=None) -> Dict[str, Any]:
+        return await self._execute_speculative(request, plan, on_draft)
 
 
 async def handle_request(request):
     server = request.app['edge_server']
     try:
-        request_data = await request.json()
+        request_data = await read_json(request)
         message_type = request_data.get('type')
         
         if message_type == MessageType.DRAFT_REQUEST.value:
@@ -279,9 +329,9 @@ async def handle_request(request):
             response = await server.handle_health_check()
         else:
             response = {'error': 'Unknown message type'}
-        return web.json_response(response)
+        return json_response(response)
     except Exception as e:
-        return web.json_response({'error': str(e)}, status=500)
+        return json_response({'error': str(e)}, status=500)
 
 
 async def handle_inference(request):
@@ -289,7 +339,7 @@ async def handle_inference(request):
     server = request.app['edge_server']
     
     try:
-        request_data = await request.json()
+        request_data = await read_json(request)
         
         # ==================== [修复点] ====================
         # 如果 requirements 是字典，手动转换成 TaskRequirements 对象
@@ -303,31 +353,64 @@ async def handle_inference(request):
             request_data['requirements'] = TaskRequirements(**filtered_reqs)
         # =================================================
         
+        stream = request_data.pop('stream', False)
         inference_request = InferenceRequest(**request_data)
         
+        if stream:
+            return await _stream_inference(request, server, inference_request)
+        
         result = await server.process_inference(inference_request)
-        return web.json_response(result)
+        return json_response(result)
     
     except Exception as e:
         import traceback
         traceback.print_exc()
-        return web.json_response({'error': str(e)}, status=500)
+        return json_response({'error': str(e)}, status=500)
+
+
+async def _stream_inference(request, server, inference_request):
+    """
+    流式推理 (NDJSON，每行一帧)
+    协同模式下起草完成即推送草稿帧，调用方不必等待云端验证就能先展示内容；
+    最后一帧为与非流式接口相同的完整结果 (以其中的 tokens 为准)
+    """
+    response = web.StreamResponse(headers={'Content-Type': 'application/x-ndjson'})
+    await response.prepare(request)
+    
+    async def on_draft(draft_response: DraftResponse):
+        await response.write(dumps({
+            'type': MessageType.INFERENCE_DRAFT.value,
+            'tokens': draft_response.draft_tokens,
+            'confidence_score': draft_response.confidence.confidence_score,
+            'edge_latency_ms': draft_response.latency_ms
+        }) + b'\n')
+    
+    try:
+        result = await server.process_inference(inference_request, on_draft=on_draft)
+        frame = {'type': MessageType.INFERENCE_RESULT.value, **result}
+    except Exception as e:
+        # 响应头已发出，错误只能作为最后一帧返回
+        frame = {'type': 'error', 'message': str(e)}
+    await response.write(dumps(frame) + b'\n')
+    await response.write_eof()
+    
+    return response
 
 
 async def handle_cache_stats(request):
     server = request.app['edge_server']
     try:
         cache_stats = server.kv_cache.get_cache_stats()
-        return web.json_response(cache_stats)
+        return json_response(cache_stats)
     except Exception as e:
-        return web.json_response({'error': str(e)}, status=500)
+        return json_response({'error': str(e)}, status=500)
 
 async def handle_simulation_control(request):
     server = request.app['edge_server']
     try:
-        data = await request.json()
+        data = await read_json(request)
         print(f"[Simulation] 收到仿真参数更新: {data}")
-        return web.json_response({'status': 'ok', 'params': data})
+        return json_response({'status': 'ok', 'params': data})
     except Exception as e:
         print(f"[Simulation] 参数更新失败: {e}")
-        return web.json_response({'error': str(e)}, status=500)
\ No newline at end of file
+        return json_response({'error': str(e)}, status=500)
\ No newline at end of file
@@ -3,9 +3,10 @@
 记录和统计推理执行历史，支持自适应决策
 """
 import time
-from typing import Dict, List, Optional, Deque
+from typing import Dict, List, Optional, Deque, NamedTuple
 from dataclasses import dataclass, field
 from collections import deque
+from itertools import islice
 import statistics
 
 from common.types import ExecutionStrategy
@@ -25,6 +26,38 @@ class ExecutionRecord:
     tokens_generated: int = 0  # 生成的 token 数
 
 
+class WindowStats(NamedTuple):
+    """某策略最近窗口内的汇总 (样本数、平均接受率、平均延迟)"""
+    count: int
+    mean_acceptance: float
+    mean_latency: float
+
+
+class _RunningWindow:
+    """固定大小的滑动窗口，增量维护接受率和延迟的累加和 (查询为 O(1))"""
+    
+    __slots__ = ('records', 'acceptance_sum', 'latency_sum')
+    
+    def __init__(self, size: int):
+        self.records: Deque[ExecutionRecord] = deque(maxlen=size)
+        self.acceptance_sum = 0.0
+        self.latency_sum = 0.0
+    
+    def append(self, record: ExecutionRecord):
+        if len(self.records) == self.records.maxlen:
+            evicted = self.records[0]
+            self.acceptance_sum -= evicted.acceptance_rate
+            self.latency_sum -= evicted.latency_ms
+        self.records.append(record)
+        self.acceptance_sum += record.acceptance_rate
+        self.latency_sum += record.latency_ms
+    
+    def clear(self):
+        self.records.clear()
+        self.acceptance_sum = 0.0
+        self.latency_sum = 0.0
+
+
 class HistoryTracker:
     """
     历史执行追踪器
@@ -32,19 +65,27 @@ class HistoryTracker:
     使用滑动窗口记录最近 N 次执行，提供统计分析功能
     """
     
-    def __init__(self, max_history_size: int = 100):
+    def __init__(self, max_history_size: int = 100, window_size: int = 20):
         """
         初始化历史追踪器
         
         Args:
             max_history_size: 滑动窗口大小（默认保留最近100条记录）
+            window_size: 增量维护汇总的近期窗口大小（自适应调整默认看最近20次）
         """
         self.max_history_size = max_history_size
+        self.window_size = window_size
         self.history: Deque[ExecutionRecord] = deque(maxlen=max_history_size)
         
-        # 分策略统计（加速查询）
-        self._strategy_stats: Dict[ExecutionStrategy, List[ExecutionRecord]] = {
-            strategy: [] for strategy in ExecutionStrategy
+        # 分策略统计（加速查询），deque 定长淘汰最旧记录
+        self._strategy_stats: Dict[ExecutionStrategy, Deque[ExecutionRecord]] = {
+            strategy: deque(maxlen=max_history_size) for strategy in ExecutionStrategy
+        }
+        
+        # 分策略近期窗口汇总（窗口不超过总历史长度，与 get_records_by_strategy(n=window_size) 一致）
+        self._windows: Dict[ExecutionStrategy, _RunningWindow] = {
+            strategy: _RunningWindow(min(window_size, max_history_size))
+            for strategy in ExecutionStrategy
         }
     
     def add_record(self, record: ExecutionRecord):
@@ -56,11 +97,9 @@ class HistoryTracker:
         """
         self.history.append(record)
         
-        # 更新分策略统计（保持窗口大小）
-        strategy_list = self._strategy_stats[record.strategy]
-        strategy_list.append(record)
-        if len(strategy_list) > self.max_history_size:
-            strategy_list.pop(0)
+        # 更新分策略统计（deque 自动保持窗口大小）
+        self._strategy_stats[record.strategy].append(record)
+        self._windows[record.strategy].append(record)
     
     def get_recent_records(self, n: int = 20) -> List[ExecutionRecord]:
         """
@@ -88,9 +127,39 @@ class HistoryTracker:
             该策略的历史记录
         """
         records = self._strategy_stats[strategy]
-        if n is None:
-            return records
-        return records[-n:]
+        if n is None or n >= len(records):
+            return list(records)
+        return list(islice(records, len(records) - n, None))
+    
+    def get_recent_window(self,
+                          strategy: ExecutionStrategy,
+                          n: Optional[int] = None) -> WindowStats:
+        """
+        获取特定策略最近 n 次的样本数、平均接受率和平均延迟
+        
+        n 等于 window_size (默认) 时直接读取增量维护的累加和；对协同策略，结果与
+        get_recent_acceptance_rate / get_avg_latency 一致 (无样本时返回相同的默认值)
+        
+        Args:
+            strategy: 执行策略
+            n: 统计最近 n 次（None 表示 window_size）
+        
+        Returns:
+            WindowStats(count, mean_acceptance, mean_latency)
+        """
+        if n is None or n == self.window_size:
+            window = self._windows[strategy]
+            count = len(window.records)
+            acceptance_sum, latency_sum = window.acceptance_sum, window.latency_sum
+        else:
+            records = self.get_records_by_strategy(strategy, n)
+            count = len(records)
+            acceptance_sum = sum(r.acceptance_rate for r in records)
+            latency_sum = sum(r.latency_ms for r in records)
+        
+        if count == 0:
+            return WindowStats(0, 0.8, 100.0)
+        return WindowStats(count, acceptance_sum / count, latency_sum / count)
     
     def get_recent_acceptance_rate(self,
                                     strategy: Optional[ExecutionStrategy] = None,
@@ -251,3 +320,5 @@ class HistoryTracker:
         self.history.clear()
         for strategy_list in self._strategy_stats.values():
             strategy_list.clear()
+        for window in self._windows.values():
+            window.clear()
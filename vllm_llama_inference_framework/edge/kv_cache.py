@@ -101,14 +101,15 @@ class LlamaCppKVCache:
             if len(self.cache) >= self.max_size:
                 self._evict_lru()
             
+            now = time.time()
             cache_data = {
                 'prompt': prompt,
                 'token_ids': token_ids.copy(),
                 'seq_len': len(token_ids),
                 'kv_tensors': kv_tensors,
                 'available_tokens': available_tokens,
-                'created_at': time.time(),
-                'last_access': time.time(),
+                'created_at': now,
+                'last_access': now,
                 'access_count': 1
             }
             
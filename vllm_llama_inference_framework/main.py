@@ -11,6 +11,12 @@ import time
 import json
 import sys
 
+# uvloop 可选: 存在时使用基于 libuv 的事件循环，否则使用标准 asyncio 循环
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
 # 默认配置 (强制使用 IPv4 + 8088 端口)
 DEFAULT_EDGE_URL = "http://127.0.0.1:8088"
 
@@ -115,6 +121,8 @@ def main():
     # Windows 平台下的 asyncio 策略调整 (防止 Event Loop 报错)
     if sys.platform.startswith('win'):
         asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    elif uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
 
     if args.mode == "client":
         # 强制修正 URL，防止用户手误输入 localhost
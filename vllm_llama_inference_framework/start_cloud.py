@@ -4,6 +4,7 @@
 """
 import asyncio
 import argparse
+import gc
 import yaml
 import sys
 import os
@@ -12,13 +13,22 @@ import os
 sys.path.append(os.getcwd())
 
 from aiohttp import web
+
+# uvloop 可选: 存在时使用基于 libuv 的事件循环，否则使用标准 asyncio 循环
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
 from cloud.cloud_server import (
     CloudServer, 
     handle_verify, 
+    handle_verify_stream, 
+    handle_verify_prefetch, 
     handle_batch_verify, 
     handle_direct_inference, 
     handle_health, 
-    handle_cache_stats
+    handle_cache_stats,
+    on_cleanup
 )
 
 async def main():
@@ -44,12 +54,18 @@ async def main():
     server = CloudServer(cloud_config)
     await server.start() # 这里的 start 只打印日志
     
+    # 模型与服务初始化产生的长期对象移入永久代，之后的 GC 不再反复扫描它们
+    gc.freeze()
+    
     # 3. 构建 Web 应用 (这是之前缺失的部分)
     app = web.Application()
     app['cloud_server'] = server
+    app.on_cleanup.append(on_cleanup)
     
     # 注册路由
     app.router.add_post('/verify', handle_verify)
+    app.router.add_post('/verify/stream', handle_verify_stream)
+    app.router.add_post('/verify/prefetch', handle_verify_prefetch)
     app.router.add_post('/verify/batch', handle_batch_verify)
     app.router.add_post('/inference/direct', handle_direct_inference)
     app.router.add_get('/health', handle_health)
@@ -59,7 +75,8 @@ async def main():
     print(f"✅ Cloud Server 启动成功! 监听端口: {port}")
     print("="*40)
     
-    runner = web.AppRunner(app)
+    # 关闭 access log: 每个请求的格式化输出在高 QPS 下开销明显
+    runner = web.AppRunner(app, access_log=None)
     await runner.setup()
     site = web.TCPSite(runner, '0.0.0.0', port)
     await site.start()
@@ -73,4 +90,6 @@ async def main():
         await runner.cleanup()
 
 if __name__ == "__main__":
+    if uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
     asyncio.run(main())
\ No newline at end of file
@@ -3,10 +3,17 @@ Edge Server 启动脚本 - 修复版 (解决 Event Loop 冲突问题)
 """
 import argparse
 import asyncio
+import gc
 import yaml
 import os
 from aiohttp import web
 
+# uvloop 可选: 存在时使用基于 libuv 的事件循环，否则使用标准 asyncio 循环
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
 # 引入 EdgeServer 和所有的路由处理函数
 from edge.edge_server import (
     EdgeServer, 
@@ -25,6 +32,9 @@ async def on_startup(app):
     print("[System] Web服务已启动，正在初始化 Edge Server 组件...")
     server = app['edge_server']
     await server.start() # 在正确的 Loop 中创建 Session
+    
+    # 模型与服务初始化产生的长期对象移入永久代，之后的 GC 不再反复扫描它们
+    gc.freeze()
 
 async def on_cleanup(app):
     """Web 服务关闭时的钩子：清理资源"""
@@ -73,7 +83,9 @@ def main():
         app, _ = await init_app(args.config)
         return app
 
-    # 使用 web.run_app 自动处理 Loop
+    # 使用 web.run_app 自动处理 Loop (安装了 uvloop 时由其策略创建)
+    if uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
     web.run_app(app_factory(), host='0.0.0.0', port=port)
 
 if __name__ == "__main__":
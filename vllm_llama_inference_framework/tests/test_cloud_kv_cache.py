@@ -0,0 +1,208 @@
+"""
+云端 KV Cache 测试
+测试块分配、LRU 淘汰与 token 前缀匹配
+"""
+import sys
+import os
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cloud.kv_cache import VLLMKVCache, PrefixTree
+
+
+def test_prefix_tree_remove_keeps_shared_nodes():
+    """测试删除键时保留其他键共享的前缀节点"""
+    print("\n=== 测试 1: 前缀树删除 ===")
+    
+    tree = PrefixTree()
+    tree.insert((1, 2, 3), 3)
+    tree.insert((1, 2, 4), 3)
+    tree.remove((1, 2, 3))
+    
+    assert tree.match_length((1, 2, 3)) == 2
+    assert tree.match_length((1, 2, 4)) == 3
+    
+    tree.remove((1, 2, 4))
+    assert tree.root.children == {}
+    
+    print("✅ 删除后共享前缀保留")
+
+
+def test_match_token_prefix_counts_full_blocks():
+    """测试 token 前缀匹配按完整块计算可复用数量"""
+    print("\n=== 测试 2: token 前缀匹配 ===")
+    
+    cache = VLLMKVCache(max_blocks=100, block_size=4)
+    system_prompt = tuple(range(10))
+    
+    assert cache.match_token_prefix(system_prompt + (100, 101)) == 0
+    # 共享 10 个 token -> 2 个完整块
+    assert cache.match_token_prefix(system_prompt + (200,)) == 2
+    
+    stats = cache.get_cache_stats()
+    assert stats['prefix_hit_tokens'] == 10
+    
+    print(f"✅ 前缀命中率: {stats['prefix_hit_rate']:.2%}")
+
+
+def test_match_token_prefix_lru_eviction():
+    """测试超过容量时淘汰最久未使用的序列"""
+    print("\n=== 测试 3: 前缀 LRU 淘汰 ===")
+    
+    cache = VLLMKVCache(max_blocks=2, block_size=1)
+    cache.match_token_prefix((1, 1))
+    cache.match_token_prefix((2, 2))
+    cache.match_token_prefix((1, 1))      # (1, 1) 变为最近使用
+    cache.match_token_prefix((3, 3))      # 淘汰 (2, 2)
+    
+    assert list(cache.token_prefixes) == [(1, 1), (3, 3)]
+    assert cache.match_token_prefix((2, 2), insert=False) == 0
+    
+    print("✅ LRU 淘汰正确")
+
+
+def test_evict_blocks_lru_order_and_id_reuse():
+    """测试块满时按访问顺序淘汰，且释放的块 ID 被复用"""
+    print("\n=== 测试 4: 块级 LRU 淘汰 ===")
+    
+    cache = VLLMKVCache(max_blocks=4, block_size=16)
+    a = cache.allocate_blocks(2, "a")
+    b = cache.allocate_blocks(2, "b")
+    cache.set_cache_blocks("a", a, seq_len=32)
+    cache.set_cache_blocks("b", b, seq_len=32)
+    
+    cache.get_cache_blocks("a")            # a 的块变为最近使用
+    c = cache.allocate_blocks(2, "c")      # 淘汰 b 的两个块
+    
+    assert sorted(c) == sorted(b)
+    assert "b" not in cache.cache
+    assert cache.get_cache_blocks("a") == tuple(a)
+    assert not cache.free_block_ids
+    assert cache.stats['evictions'] == 2
+    
+    print("✅ 淘汰顺序与 ID 复用正确")
+
+
+def test_arc_policy_keeps_hot_entry_under_scan():
+    """测试 ARC: 一次性 prompt 的扫描不会淘汰被多次访问的热点条目"""
+    print("\n=== 测试 5: ARC 抗扫描 ===")
+    
+    for policy in ("arc", "2q"):
+        cache = VLLMKVCache(max_blocks=4, block_size=16, eviction_policy=policy)
+        cache.set_cache_blocks("system", cache.allocate_blocks(1, "system"), seq_len=16)
+        cache.get_cache_blocks("system")
+        
+        for i in range(20):
+            key = f"scan-{i}"
+            cache.set_cache_blocks(key, cache.allocate_blocks(1, key), seq_len=16)
+            cache.get_cache_blocks("system")
+        
+        assert "system" in cache.cache, policy
+        assert len(cache.cache) <= 4
+        assert len(cache.block_table) == len(cache.cache)
+    
+    print("✅ 热点条目在扫描中保留")
+
+
+def test_arc_policy_ghost_hit_adapts_p():
+    """测试 ARC: B1 幽灵命中增大 T1 目标大小 p"""
+    print("\n=== 测试 6: ARC 自适应 ===")
+    
+    from cloud.kv_cache import ARCCachePolicy
+    
+    policy = ARCCachePolicy(2)
+    assert policy.insert("a") == []
+    assert policy.insert("b") == []
+    assert policy.insert("c") == ["a"]     # T1 已满，a 被淘汰
+    
+    policy.touch("b")                       # b 进入 T2
+    policy.insert("d")                      # 淘汰 c 到 B1
+    assert "c" in policy.b1
+    
+    policy.insert("c")                      # B1 幽灵命中
+    assert policy.p > 0
+    assert "c" in policy.t2
+    
+    print(f"✅ p = {policy.p}")
+
+
+def test_prefix_tree_radix_split_and_merge():
+    """测试基数树: 插入时拆分边，删除后合并，字符串键的最长匹配"""
+    print("\n=== 测试 7: 基数树拆分与合并 ===")
+    
+    tree = PrefixTree()
+    tree.insert("system: you are", 1)
+    tree.insert("system: you are helpful", 2)
+    tree.insert("system: be brief", 3)
+    
+    match = tree.find_longest_match("system: you are helpful and kind")
+    assert match == {'key': "system: you are helpful", 'value': 2, 'match_len': 23}
+    assert tree.find_longest_match("system: you were") is None
+    assert tree.match_length("system: you were") == 12
+    
+    # "system: " 为拆分出的中间边
+    (middle,) = tree.root.children.values()
+    assert middle.label == "system: "
+    
+    tree.remove("system: be brief")
+    (merged,) = tree.root.children.values()
+    assert merged.label == "system: you are"
+    assert tree.find_longest_match("system: you are!")['value'] == 1
+    
+    print("✅ 拆分/合并正确")
+
+
+def test_token_prefix_not_blocked_by_cache_lock():
+    """测试 token 前缀匹配使用独立的锁，不被缓存簿记阻塞"""
+    print("\n=== 测试 8: 锁拆分 ===")
+    
+    cache = VLLMKVCache(max_blocks=100, block_size=2)
+    
+    with cache.lock:
+        assert cache.match_token_prefix((1, 2, 3, 4)) == 0
+        assert cache.match_token_prefix((1, 2, 3, 5)) == 1
+    
+    assert cache.get_cache_stats()['prefix_hit_tokens'] == 3
+    
+    print("✅ 前缀匹配不受 self.lock 影响")
+
+
+def test_stats_read_without_lock_and_reset_in_place():
+    """测试统计读取不需要锁，清空时计数器原地清零"""
+    print("\n=== 测试 9: 无锁统计 ===")
+    
+    cache = VLLMKVCache(max_blocks=10)
+    cache.get_cache_blocks("missing")
+    stats_dict = cache.stats
+    
+    with cache.lock:
+        assert cache.get_cache_stats()['misses'] == 1
+    
+    cache.clear_all_cache()
+    assert cache.stats is stats_dict
+    assert cache.get_cache_stats()['misses'] == 0
+    
+    print("✅ 统计读取与清零正确")
+
+
+def test_block_ids_grow_beyond_max_blocks():
+    """测试单次分配超过 max_blocks 时扩充块 ID 空间，命中后块移到访问顺序末尾"""
+    print("\n=== 测试 10: 块 ID 扩容 ===")
+    
+    cache = VLLMKVCache(max_blocks=2, block_size=16)
+    blocks = cache.allocate_blocks(3, "big")     # 超过 max_blocks
+    cache.set_cache_blocks("big", blocks, seq_len=48)
+    
+    assert len(set(blocks)) == 3
+    assert cache.block_id_capacity >= 3
+    assert cache.block_table[blocks[0]] == "big"
+    
+    cache = VLLMKVCache(max_blocks=4, block_size=16)
+    hot = cache.allocate_blocks(2, "hot")
+    cold = cache.allocate_blocks(1, "cold")
+    cache.set_cache_blocks("hot", hot, seq_len=32)
+    cache.get_cache_blocks("hot")
+    assert list(cache.block_table) == cold + hot
+    
+    print("✅ 块 ID 扩容与访问顺序正确")
@@ -0,0 +1,391 @@
+"""
+云端验证器测试（不需要 vLLM / GPU）
+测试 Draft 与云端结果的前缀匹配逻辑
+"""
+import sys
+import os
+import asyncio
+from types import SimpleNamespace
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cloud.draft_verifier as draft_verifier
+from cloud.draft_verifier import DraftVerifier, common_prefix_len
+from common.types import VerifyRequest, InferenceRequest, ExecutionPlan, ExecutionStrategy
+
+
+class FakeLLM:
+    """记录 generate 调用的假模型：对每个 prompt 返回固定续写"""
+    
+    def __init__(self, continuation: str):
+        self.continuation = continuation
+        self.calls = []
+    
+    def generate(self, prompts, sampling_params):
+        self.calls.append(list(prompts))
+        return [
+            SimpleNamespace(outputs=[SimpleNamespace(
+                text=self.continuation,
+                token_ids=list(range(len(self.continuation)))  # 每个字符记一个 token
+            )])
+            for _ in prompts
+        ]
+
+
+class FakeDraftVerifier(DraftVerifier):
+    """跳过 vLLM 加载的验证器"""
+    
+    def _load_model(self, model_path):
+        return FakeLLM(" world")
+
+
+def make_verifier(monkeypatch, **kwargs):
+    monkeypatch.setattr(draft_verifier, 'SamplingParams', lambda **kw: SimpleNamespace(**kw))
+    return FakeDraftVerifier("fake", **kwargs)
+
+
+def test_common_prefix_len_basic():
+    """测试基本前缀匹配"""
+    print("\n=== 测试 1: 基本前缀匹配 ===")
+    
+    assert common_prefix_len("hello world", "hello there") == 6
+    assert common_prefix_len("abc", "abc") == 3
+    assert common_prefix_len("abc", "xbc") == 0
+    
+    print("✅ 前缀长度正确")
+
+
+def test_common_prefix_len_edge_cases():
+    """测试空串、长度不等、非 ASCII 字符"""
+    print("\n=== 测试 2: 边界情况 ===")
+    
+    assert common_prefix_len("", "abc") == 0
+    assert common_prefix_len("abc", "") == 0
+    assert common_prefix_len("ab", "abcdef") == 2
+    assert common_prefix_len("abcdef", "ab") == 2
+    assert common_prefix_len("你好，世界", "你好，朋友") == 3
+    assert common_prefix_len("🚀 go", "🚀 stop") == 2
+    
+    print("✅ 边界情况正确")
+
+
+def test_common_prefix_len_matches_naive_scan():
+    """测试倍增 + 二分结果与逐字符扫描一致"""
+    print("\n=== 测试 2b: 与逐字符扫描对照 ===")
+    
+    import random
+    rng = random.Random(0)
+    
+    for _ in range(500):
+        n = rng.randint(0, 300)
+        a = ''.join(rng.choice('ab') for _ in range(n))
+        b = a[:rng.randint(0, n)] + ''.join(rng.choice('ab') for _ in range(rng.randint(0, 50)))
+        
+        expected = 0
+        for x, y in zip(a, b):
+            if x != y:
+                break
+            expected += 1
+        
+        assert common_prefix_len(a, b) == expected
+    
+    print("✅ 500 组随机用例一致")
+
+
+def test_concurrent_verifies_share_one_generate(monkeypatch):
+    """测试并发验证请求被合并为一次 generate"""
+    print("\n=== 测试 3: 动态微批 ===")
+    
+    verifier = make_verifier(monkeypatch, batch_timeout_ms=10)
+    requests = [
+        VerifyRequest(prompt=f"p{i}", draft_tokens=[" wor", "ld"], draft_token_ids=[])
+        for i in range(5)
+    ]
+    
+    async def run():
+        return await asyncio.gather(*[verifier.verify_draft(r) for r in requests])
+    
+    responses = asyncio.run(run())
+    
+    assert len(verifier.model.calls) == 1
+    assert verifier.model.calls[0] == [f"p{i}" for i in range(5)]
+    assert verifier.avg_batch_size() == 5.0
+    assert all(r.acceptance_rate == 1.0 for r in responses)
+    
+    print("✅ 5 个请求合并为 1 次 generate")
+
+
+def test_batch_respects_max_batch_size(monkeypatch):
+    """测试单批不超过 max_batch_size"""
+    print("\n=== 测试 4: 批大小上限 ===")
+    
+    verifier = make_verifier(monkeypatch, max_batch_size=2, batch_timeout_ms=10)
+    requests = [
+        VerifyRequest(prompt=f"p{i}", draft_tokens=["xyz"], draft_token_ids=[])
+        for i in range(5)
+    ]
+    
+    async def run():
+        return await asyncio.gather(*[verifier.verify_draft(r) for r in requests])
+    
+    responses = asyncio.run(run())
+    
+    assert [len(c) for c in verifier.model.calls] == [2, 2, 1]
+    assert all(r.acceptance_rate == 0.0 for r in responses)
+    
+    print("✅ 批大小上限生效")
+
+
+def test_final_text_only_when_requested(monkeypatch):
+    """测试 final_text 仅在请求需要时拼接"""
+    print("\n=== 测试 5: final_text 按需返回 ===")
+    
+    verifier = make_verifier(monkeypatch, batch_timeout_ms=0)
+    
+    full = asyncio.run(verifier.verify_draft(
+        VerifyRequest(prompt="hello", draft_tokens=[" wor"], draft_token_ids=[])
+    ))
+    lean = asyncio.run(verifier.verify_draft(
+        VerifyRequest(prompt="hello", draft_tokens=[" wor"], draft_token_ids=[], return_final_text=False)
+    ))
+    
+    assert full.final_text == "hello world"
+    assert lean.final_text is None
+    assert "hello" + "".join(lean.verified_tokens) == full.final_text
+    
+    print("✅ final_text 按需拼接")
+
+
+def test_prompt_tokenized_once(monkeypatch):
+    """测试 prompt 只分词一次，并以 token ID 送入 generate"""
+    print("\n=== 测试 6: prompt 分词缓存 ===")
+    
+    encoded = []
+    
+    class FakeTokenizer:
+        def encode(self, text):
+            encoded.append(text)
+            return [ord(c) for c in text]
+    
+    verifier = make_verifier(monkeypatch, batch_timeout_ms=0)
+    verifier.model.get_tokenizer = lambda: FakeTokenizer()
+    verifier._tokenizer = verifier._get_tokenizer()
+    
+    for _ in range(3):
+        asyncio.run(verifier.verify_draft(
+            VerifyRequest(prompt="hi", draft_tokens=[" wor"], draft_token_ids=[])
+        ))
+    asyncio.run(verifier.verify_draft(
+        VerifyRequest(prompt="hi", draft_tokens=[" wor"], draft_token_ids=[], prompt_token_ids=[7, 8])
+    ))
+    
+    assert encoded == ["hi"]
+    assert verifier.model.calls[0] == [{'prompt_token_ids': [104, 105]}]
+    assert verifier.model.calls[-1] == [{'prompt_token_ids': [7, 8]}]
+    
+    print("✅ prompt 分词结果被复用")
+
+
+def test_verify_stream_frames(monkeypatch):
+    """测试流式验证: 先乐观接受帧，后真实结果 (含 rollback_from)"""
+    print("\n=== 测试 7: 流式验证 ===")
+    
+    from aiohttp import web
+    from aiohttp.test_utils import TestClient, TestServer
+    from cloud.cloud_server import CloudServer, handle_verify_stream
+    from common.codec import loads
+    
+    server = CloudServer.__new__(CloudServer)
+    server.draft_verifier = make_verifier(monkeypatch, batch_timeout_ms=0)
+    server.stats = {'total_requests': 0, 'total_verifications': 0,
+                    'sum_acceptance_rate': 0.0, 'sum_latency_ms': 0.0}
+    
+    async def run():
+        app = web.Application()
+        app['cloud_server'] = server
+        app.router.add_post('/verify/stream', handle_verify_stream)
+        async with TestClient(TestServer(app)) as client:
+            resp = await client.post('/verify/stream', json={'data': {
+                'prompt': "hello", 'draft_tokens': [" wo", "rm"], 'draft_token_ids': []
+            }})
+            return [loads(line) for line in (await resp.read()).splitlines()]
+    
+    optimistic, final = asyncio.run(run())
+    
+    assert optimistic == {'type': 'optimistic_accept', 'prefix_len': 5}
+    assert final['type'] == 'verify_response'
+    assert final['data']['rollback_from'] == 4
+    # " wo" 被完整接受，"rm" 从第 2 个字符起出错
+    assert final['data']['corrected_positions'] == [1]
+    
+    print("✅ 帧顺序与回滚位置正确")
+
+
+def test_direct_inference_joins_verify_batch(monkeypatch):
+    """测试直接推理与验证请求合并为同一次 generate，且采样参数被复用"""
+    print("\n=== 测试 8: 直接推理走微批队列 ===")
+    
+    from cloud.cloud_server import CloudServer
+    
+    draft_verifier.cached_sampling_params.cache_clear()
+    server = CloudServer.__new__(CloudServer)
+    server.draft_verifier = make_verifier(monkeypatch, batch_timeout_ms=10)
+    
+    direct = {'data': {'prompt': "d", 'max_tokens': 8}}
+    verify = VerifyRequest(prompt="v", draft_tokens=[" wor"], draft_token_ids=[])
+    
+    async def run():
+        return await asyncio.gather(
+            server.handle_direct_inference(direct),
+            server.handle_direct_inference(direct),
+            server.draft_verifier.verify_draft(verify)
+        )
+    
+    first, second, _ = asyncio.run(run())
+    
+    assert len(server.draft_verifier.model.calls) == 1
+    assert first['data']['text'] == " world"
+    assert first['data']['num_tokens'] == 6
+    assert draft_verifier.cached_sampling_params.cache_info().hits >= 1
+    
+    print("✅ 直接推理与验证共享一次 generate")
+
+
+def test_prefetched_ground_truth_reused(monkeypatch):
+    """测试预取的标准答案被验证请求复用，长度不足的预取被取消重发"""
+    print("\n=== 测试 9: 预取标准答案 ===")
+    
+    verifier = make_verifier(monkeypatch, batch_timeout_ms=0)
+    
+    async def run(draft_max_tokens):
+        verifier.prefetch_ground_truth("hello", draft_max_tokens)
+        # 模拟边端起草期间让出事件循环，云端此时已在生成
+        await asyncio.sleep(0.01)
+        calls_before_verify = len(verifier.model.calls)
+        response = await verifier.verify_draft(
+            VerifyRequest(prompt="hello", draft_tokens=[" wo", "rld"], draft_token_ids=[])
+        )
+        return calls_before_verify, response
+    
+    calls_before_verify, response = asyncio.run(run(8))
+    
+    assert calls_before_verify == 1
+    assert len(verifier.model.calls) == 1
+    assert response.acceptance_rate == 1.0
+    assert not verifier._prefetched
+    
+    # draft 超过预取长度时不能复用 (max_tokens 不足以覆盖 draft)
+    verifier.model.calls.clear()
+    asyncio.run(run(1))
+    
+    assert len(verifier.model.calls) == 2
+    
+    print("✅ 预取结果复用正确")
+
+
+def test_async_engine_skips_batcher(monkeypatch):
+    """测试 AsyncLLMEngine 路径: 直接 await 引擎输出，不经过微批与 executor"""
+    print("\n=== 测试 10: AsyncLLMEngine ===")
+    
+    class FakeAsyncEngine:
+        def __init__(self):
+            self.request_ids = []
+        
+        async def generate(self, prompt, sampling_params, request_id):
+            self.request_ids.append(request_id)
+            for text in (" wo", " world"):
+                yield SimpleNamespace(outputs=[SimpleNamespace(text=text)])
+    
+    class AsyncEngineVerifier(DraftVerifier):
+        def _load_model(self, model_path):
+            return FakeAsyncEngine()
+    
+    monkeypatch.setattr(draft_verifier, 'AsyncLLMEngine', FakeAsyncEngine)
+    monkeypatch.setattr(draft_verifier, 'SamplingParams', lambda **kw: SimpleNamespace(**kw))
+    verifier = AsyncEngineVerifier("fake")
+    
+    async def run():
+        return await asyncio.gather(*[
+            verifier.verify_draft(VerifyRequest(prompt=f"p{i}", draft_tokens=[" world"], draft_token_ids=[]))
+            for i in range(3)
+        ])
+    
+    responses = asyncio.run(run())
+    
+    assert all(r.acceptance_rate == 1.0 for r in responses)
+    assert len(set(verifier.model.request_ids)) == 3
+    assert verifier._batch_task is None
+    
+    print("✅ 异步引擎路径正确")
+
+
+def test_non_strict_verify_shortcuts(monkeypatch):
+    """测试非严格模式: 空草稿不调用 vLLM，高接受率时缩短标准答案长度"""
+    print("\n=== 测试 11: 非严格验证 ===")
+    
+    verifier = make_verifier(monkeypatch, batch_timeout_ms=0, strict_verify=False)
+    
+    empty = asyncio.run(verifier.verify_draft(
+        VerifyRequest(prompt="hello", draft_tokens=[], draft_token_ids=[])
+    ))
+    assert empty.acceptance_rate == 1.0
+    assert empty.final_text == "hello"
+    assert verifier.model.calls == []
+    
+    seen_max_tokens = []
+    original_generate = verifier.generate
+    
+    async def recording_generate(prompt, sampling_params, prompt_token_ids=None):
+        seen_max_tokens.append(sampling_params.max_tokens)
+        return await original_generate(prompt, sampling_params, prompt_token_ids)
+    
+    verifier.generate = recording_generate
+    request = VerifyRequest(prompt="hello", draft_tokens=[" wor", "ld"], draft_token_ids=[])
+    asyncio.run(verifier.verify_draft(request))
+    verifier.acceptance_ewma = 0.99
+    asyncio.run(verifier.verify_draft(request))
+    
+    assert seen_max_tokens == [22, 7]
+    
+    print("✅ 空草稿短路与自适应长度正确")
+
+
+def test_cloud_direct_through_edge(monkeypatch):
+    """测试 CLOUD_DIRECT 端到端: 边端经 /inference/direct 调用云端，并按云端 token 数记录历史"""
+    print("\n=== 测试 12: 边端 CLOUD_DIRECT ===")
+    
+    from cloud.cloud_server import CloudServer, handle_direct_inference
+    from edge.edge_server import EdgeServer
+    
+    cloud = CloudServer.__new__(CloudServer)
+    cloud.draft_verifier = make_verifier(monkeypatch, batch_timeout_ms=0)
+    app = web.Application()
+    app['cloud_server'] = cloud
+    app.router.add_post('/inference/direct', handle_direct_inference)
+    
+    async def run():
+        server = TestServer(app)
+        await server.start_server()
+        edge = EdgeServer({}, cloud_endpoint=str(server.make_url('')).rstrip('/'))
+        edge.f1_decision.decide = lambda request: ExecutionPlan(
+            strategy=ExecutionStrategy.CLOUD_DIRECT, params={}
+        )
+        try:
+            result = await edge.process_inference(InferenceRequest(prompt="hi", max_tokens=8))
+            return edge, result
+        finally:
+            await edge.stop()
+            await server.close()
+    
+    edge, result = asyncio.run(run())
+    
+    assert result['strategy'] == ExecutionStrategy.CLOUD_DIRECT.value
+    assert result['text'] == " world"
+    assert result['num_tokens'] == 6
+    assert edge.f1_decision.history_tracker.get_recent_records(1)[0].tokens_generated == 6
+    
+    print("✅ CLOUD_DIRECT 结果与历史记录正确")
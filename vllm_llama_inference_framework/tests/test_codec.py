@@ -0,0 +1,46 @@
+"""
+JSON 编解码模块测试
+"""
+import sys
+import os
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from common.codec import dumps, loads
+from common.types import VerifyResponse, MessageType
+
+
+def test_roundtrip_dataclass_and_enum():
+    """测试 dataclass 与 Enum 的序列化"""
+    print("\n=== 测试 1: dataclass / Enum ===")
+    
+    resp = VerifyResponse(
+        verified_tokens=["你好", "世界"],
+        verified_token_ids=[1, 2],
+        accepted_count=2,
+        total_count=2,
+        acceptance_rate=1.0,
+        corrected_positions=[],
+        final_text="你好世界"
+    )
+    payload = loads(dumps({'type': MessageType.VERIFY_RESPONSE, 'data': resp}))
+    
+    assert payload['type'] == MessageType.VERIFY_RESPONSE.value
+    assert payload['data']['verified_tokens'] == ["你好", "世界"]
+    assert payload['data']['final_text'] == "你好世界"
+    
+    print("✅ dataclass / Enum 序列化正确")
+
+
+def test_roundtrip_numpy():
+    """测试 NumPy 数组与标量的序列化"""
+    print("\n=== 测试 2: NumPy ===")
+    
+    payload = loads(dumps({'ids': np.arange(3, dtype=np.int32), 'p': np.float64(0.5)}))
+    
+    assert payload == {'ids': [0, 1, 2], 'p': 0.5}
+    
+    print("✅ NumPy 序列化正确")
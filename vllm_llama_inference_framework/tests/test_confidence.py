@@ -0,0 +1,102 @@
+"""
+置信度计算测试
+对照固定输入下各策略的参考分数
+"""
+import sys
+import os
+import math
+
+import numpy as np
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.types import TokenProb, ConfidenceStrategy
+from edge.confidence import ConfidenceCalculator, ConfidenceEnsemble, AblatedConfidenceCalculator
+
+
+PROBS = [0.9, 0.5, 0.7, 0.2, 0.95, 0.6]
+TOKEN_PROBS = [TokenProb(i, str(i), p, math.log(p)) for i, p in enumerate(PROBS)]
+
+# 参考分数 (逐项 Python 实现的结果)
+EXPECTED_SCORES = {
+    ConfidenceStrategy.MAX_PROB: 0.6416666666666667,
+    ConfidenceStrategy.ENTROPY: 0.8631817899056283,
+    ConfidenceStrategy.TEMPERATURE: 0.24675324675324672,
+    ConfidenceStrategy.TOP_K_AGG: 0.8248175182481752,
+}
+
+
+def test_strategy_scores():
+    """测试各策略的分数与统计量"""
+    print("\n=== 测试 1: 各策略分数 ===")
+    
+    for strategy, expected in EXPECTED_SCORES.items():
+        metrics = ConfidenceCalculator(strategy).calculate_confidence(TOKEN_PROBS)
+        assert math.isclose(metrics.confidence_score, expected, rel_tol=1e-9), strategy
+        assert math.isclose(metrics.entropy, 1.3681821009437165, rel_tol=1e-9)
+        assert metrics.max_prob == 0.95 and metrics.min_prob == 0.2
+        assert math.isclose(metrics.avg_prob, sum(PROBS) / len(PROBS), rel_tol=1e-12)
+    
+    print("✅ 分数与参考值一致")
+
+
+def test_empty_and_ensemble():
+    """测试空输入、集成与消融"""
+    print("\n=== 测试 2: 空输入 / 集成 / 消融 ===")
+    
+    assert ConfidenceCalculator().calculate_confidence([]).confidence_score == 0.0
+    
+    score, individual = ConfidenceEnsemble().ensemble_confidence(TOKEN_PROBS)
+    assert math.isclose(score, 0.7765553249401567, rel_tol=1e-9)
+    assert set(individual) == {'max_prob', 'entropy', 'top_k_agg'}
+    
+    ablated = AblatedConfidenceCalculator(ConfidenceStrategy.ENTROPY, disable_entropy=True)
+    assert math.isclose(
+        ablated.calculate_confidence(TOKEN_PROBS).confidence_score,
+        EXPECTED_SCORES[ConfidenceStrategy.MAX_PROB], rel_tol=1e-9
+    )
+    
+    print("✅ 空输入/集成/消融正确")
+
+
+def test_top_k_short_input_and_ensemble_consistency():
+    """测试 token 数少于 k 的 Top-K，以及集成分数与单独计算一致"""
+    print("\n=== 测试 3: Top-K 短输入 / 集成一致性 ===")
+    
+    short = TOKEN_PROBS[:3]  # 0.9, 0.5, 0.7
+    score = ConfidenceCalculator(ConfidenceStrategy.TOP_K_AGG).calculate_confidence(short).confidence_score
+    assert math.isclose(score, (0.9 + 0.7 / 2 + 0.5 / 3) / (1 + 1 / 2 + 1 / 3), rel_tol=1e-12)
+    
+    _, individual = ConfidenceEnsemble().ensemble_confidence(TOKEN_PROBS)
+    for strategy in (ConfidenceStrategy.MAX_PROB, ConfidenceStrategy.ENTROPY, ConfidenceStrategy.TOP_K_AGG):
+        assert math.isclose(individual[strategy.value], EXPECTED_SCORES[strategy], rel_tol=1e-9)
+    
+    print("✅ Top-K 与集成一致")
+
+
+def test_stats_kernel_matches_numpy():
+    """测试单循环统计内核 (numba 可选) 与 NumPy 实现一致"""
+    print("\n=== 测试 4: 统计内核 ===")
+    
+    from edge.confidence import _confidence_stats
+    
+    probs = np.array(PROBS + [0.0])
+    max_p, min_p, avg_p, entropy = _confidence_stats(probs)
+    
+    assert max_p == 0.95 and min_p == 0.0
+    assert math.isclose(avg_p, probs.mean(), rel_tol=1e-12)
+    assert math.isclose(entropy, 1.3681821009437165, rel_tol=1e-9)
+    
+    print("✅ 统计内核与 NumPy 一致")
+
+
+def test_top_k_parameter():
+    """测试可配置的 K"""
+    print("\n=== 测试 5: Top-K 参数 ===")
+    
+    calc = ConfidenceCalculator(ConfidenceStrategy.TOP_K_AGG, top_k=2)
+    score = calc.calculate_confidence(TOKEN_PROBS).confidence_score
+    assert math.isclose(score, (0.95 + 0.9 / 2) / 1.5, rel_tol=1e-12)
+    
+    print("✅ K=2 结果正确")
@@ -0,0 +1,264 @@
+"""
+HTTP 客户端测试（本地 aiohttp 测试服务器，不需要边端/云端模型）
+测试请求编码、响应解析与统计
+"""
+import sys
+import os
+import asyncio
+import dataclasses
+import threading
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from common.codec import json_response, read_json
+from common.http_client import HTTPClient, SimpleHTTPClient, LATENCY_WINDOW
+from edge.edge_server import handle_inference
+from common.types import (
+    InferenceRequest, VerifyRequest, DraftRequest, DraftResponse, ConfidenceMetrics,
+    ConfidenceStrategy, TokenProb, KVCacheInfo, MessageType
+)
+
+
+async def _echo_verify(request):
+    """把收到的验证请求原样拼成验证响应"""
+    data = (await read_json(request))['data']
+    return json_response({
+        'type': MessageType.VERIFY_RESPONSE.value,
+        'data': {
+            'verified_tokens': data['draft_tokens'],
+            'verified_token_ids': data['draft_token_ids'],
+            'accepted_count': len(data['draft_tokens']),
+            'total_count': len(data['draft_tokens']),
+            'acceptance_rate': 1.0,
+            'corrected_positions': [],
+            'final_text': data['prompt'] + ''.join(data['draft_tokens'])
+        }
+    })
+
+
+async def _echo_batch_verify(request):
+    """批量版本: 逐条复用单条的响应格式"""
+    requests = (await read_json(request))['data']['requests']
+    return json_response({
+        'type': 'batch_verify_response',
+        'data': {'results': [
+            {
+                'verified_tokens': r['draft_tokens'],
+                'verified_token_ids': [],
+                'accepted_count': len(r['draft_tokens']),
+                'total_count': len(r['draft_tokens']),
+                'acceptance_rate': 1.0,
+                'corrected_positions': [],
+                'final_text': r['prompt'] + ''.join(r['draft_tokens'])
+            }
+            for r in requests
+        ]}
+    })
+
+
+async def _fixed_draft(request):
+    """返回固定的 Draft 响应 (带 token_probs)"""
+    await read_json(request)
+    return json_response({
+        'type': MessageType.DRAFT_RESPONSE.value,
+        'data': DraftResponse(
+            draft_tokens=["a", "b"],
+            draft_token_ids=[1, 2],
+            confidence=ConfidenceMetrics(
+                confidence_score=0.9,
+                strategy=ConfidenceStrategy.MAX_PROB,
+                token_probs=[TokenProb(1, "a", 0.9, -0.1), TokenProb(2, "b", 0.8, -0.2)]
+            ),
+            kv_cache_info=KVCacheInfo(),
+            latency_ms=1.5
+        )
+    })
+
+
+def run_with_server(coro_fn):
+    """启动测试服务器，用指向它的 HTTPClient 运行 coro_fn(client)"""
+    async def run():
+        app = web.Application()
+        app.router.add_post('/verify', _echo_verify)
+        app.router.add_post('/verify/batch', _echo_batch_verify)
+        app.router.add_post('/draft', _fixed_draft)
+        server = TestServer(app)
+        await server.start_server()
+        try:
+            async with HTTPClient(str(server.make_url('/'))) as client:
+                return await coro_fn(client)
+        finally:
+            await server.close()
+    
+    return asyncio.run(run())
+
+
+def test_send_verify_request_roundtrip():
+    """测试验证请求的编码与响应解析"""
+    print("\n=== 测试 1: 验证请求往返 ===")
+    
+    request = VerifyRequest(prompt="你好", draft_tokens=["，", "世界"], draft_token_ids=[1, 2])
+    
+    async def send(client):
+        return await client.send_verify_request(request), client.get_client_stats()
+    
+    response, stats = run_with_server(send)
+    
+    assert response.final_text == "你好，世界"
+    assert response.verified_token_ids == [1, 2]
+    assert stats['responses_received'] == 1
+    
+    print("✅ 往返正确")
+
+
+def test_send_batch_verify_requests():
+    """测试批量验证: 请求对象直接编码，响应按顺序还原"""
+    print("\n=== 测试 2: 批量验证 ===")
+    
+    requests = [
+        VerifyRequest(prompt=f"p{i}", draft_tokens=[f" t{i}"], draft_token_ids=[])
+        for i in range(3)
+    ]
+    
+    async def send(client):
+        return await client.send_batch_verify_requests(requests)
+    
+    responses = run_with_server(send)
+    
+    assert [r.final_text for r in responses] == ["p0 t0", "p1 t1", "p2 t2"]
+    
+    print("✅ 批量往返正确")
+
+
+def test_send_draft_request_decodes_confidence():
+    """测试 Draft 响应的 confidence 还原，以及跳过 token_probs 还原"""
+    print("\n=== 测试 3: Draft 响应解码 ===")
+    
+    request = DraftRequest(prompt="hi")
+    
+    async def send(client):
+        full = await client.send_draft_request(request)
+        lazy = await client.send_draft_request(request, decode_token_probs=False)
+        return full, lazy
+    
+    full, lazy = run_with_server(send)
+    
+    assert full.confidence.confidence_score == 0.9
+    assert full.confidence.strategy is ConfidenceStrategy.MAX_PROB
+    assert full.confidence.token_probs[1] == TokenProb(2, "b", 0.8, -0.2)
+    assert full.kv_cache_info == KVCacheInfo()
+    # KVCacheInfo 不可变 (草稿生成器在多个响应间共享同一实例)
+    try:
+        full.kv_cache_info.hit_rate = 1.0
+        assert False, "KVCacheInfo 应不可变"
+    except dataclasses.FrozenInstanceError:
+        pass
+    
+    assert lazy.confidence.confidence_score == 0.9
+    assert lazy.confidence.token_probs[0]['token'] == "a"
+    
+    print("✅ Draft 响应解码正确")
+
+
+def test_latency_stats_window():
+    """测试延迟统计只覆盖最近的窗口"""
+    print("\n=== 测试 4: 延迟统计窗口 ===")
+    
+    client = HTTPClient("http://localhost:1")
+    assert client.get_client_stats()['avg_latency_ms'] == 0.0
+    
+    # 先写满一窗口 1000ms，再写满一窗口 10ms，旧值应全部被覆盖
+    for latency in [1.0] * LATENCY_WINDOW + [0.01] * LATENCY_WINDOW:
+        client._update_stats(latency, success=True)
+    client._update_stats(0.5, success=False)
+    
+    stats = client.get_client_stats()
+    assert stats['requests_sent'] == 2 * LATENCY_WINDOW + 1
+    assert stats['errors'] == 1
+    assert abs(stats['avg_latency_ms'] - 10.0) < 1e-3
+    assert abs(stats['p99_latency_ms'] - 10.0) < 1e-3
+    
+    print("✅ 延迟窗口统计正确")
+
+
+def test_simple_client_reuses_session():
+    """测试同步客户端在多次调用间复用同一个会话"""
+    print("\n=== 测试 5: 同步客户端复用会话 ===")
+    
+    # 测试服务器运行在独立线程的事件循环上
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    
+    async def start_server():
+        app = web.Application()
+        app.router.add_post('/verify', _echo_verify)
+        server = TestServer(app)
+        await server.start_server()
+        return server
+    
+    server = asyncio.run_coroutine_threadsafe(start_server(), loop).result()
+    try:
+        payload = {'data': {'prompt': "a", 'draft_tokens': ["b"], 'draft_token_ids': [1]}}
+        with SimpleHTTPClient(str(server.make_url('/'))) as client:
+            session = client.client.session
+            for _ in range(3):
+                assert client.send_request('POST', '/verify', payload)['data']['final_text'] == "ab"
+            assert client.client.session is session
+            assert client.client.get_client_stats()['responses_received'] == 3
+        assert client.loop.is_closed()
+    finally:
+        asyncio.run_coroutine_threadsafe(server.close(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+    
+    print("✅ 会话复用正确")
+
+
+class FakeEdgeServer:
+    """起草后回调 on_draft，再返回固定的最终结果"""
+    
+    async def process_inference(self, inference_request, on_draft=None):
+        if on_draft is not None:
+            await on_draft(DraftResponse(
+                draft_tokens=["草", "稿"],
+                draft_token_ids=[1, 2],
+                confidence=ConfidenceMetrics(0.7, ConfidenceStrategy.MAX_PROB, []),
+                kv_cache_info=KVCacheInfo(),
+                latency_ms=3.0
+            ))
+        return {'text': inference_request.prompt + "结果", 'tokens': ["结果"], 'acceptance_rate': 0.5}
+
+
+def test_stream_inference_request():
+    """测试流式推理: 先收到草稿帧，再收到最终结果帧"""
+    print("\n=== 测试 6: 流式推理 ===")
+    
+    async def run():
+        app = web.Application()
+        app['edge_server'] = FakeEdgeServer()
+        app.router.add_post('/inference', handle_inference)
+        server = TestServer(app)
+        await server.start_server()
+        try:
+            async with HTTPClient(str(server.make_url('/'))) as client:
+                frames = [f async for f in client.stream_inference_request(InferenceRequest(prompt="问"))]
+                return frames, client.get_client_stats()
+        finally:
+            await server.close()
+    
+    frames, stats = asyncio.run(run())
+    
+    assert [f['type'] for f in frames] == [
+        MessageType.INFERENCE_DRAFT.value, MessageType.INFERENCE_RESULT.value
+    ]
+    assert frames[0]['tokens'] == ["草", "稿"]
+    assert frames[1]['text'] == "问结果"
+    assert stats['responses_received'] == 1
+    
+    print("✅ 流式帧顺序正确")
@@ -0,0 +1,103 @@
+"""
+HTTP 服务器框架测试（本地 aiohttp 测试服务器，使用假的边端服务）
+测试请求体只解析一次并在中间件/处理器之间共享
+"""
+import sys
+import os
+import asyncio
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiohttp.test_utils import TestServer
+
+from common.http_client import HTTPClient
+from common.http_server import EdgeHTTPServer
+
+
+class FakeEdgeServer:
+    """只记录收到的 Draft 请求数据"""
+
+    def __init__(self):
+        self.received = []
+
+    async def handle_draft_request(self, data):
+        self.received.append(data)
+        return {'type': 'draft_response', 'data': {'echo': data['data']['prompt']}}
+
+    async def handle_health_check(self):
+        return {'status': 'healthy'}
+
+
+def run_with_server(http_server, coro_fn):
+    """启动 http_server.app，用指向它的 HTTPClient 运行 coro_fn(client)"""
+    async def run():
+        server = TestServer(http_server.app)
+        await server.start_server()
+        try:
+            async with HTTPClient(str(server.make_url('/')), max_retries=0) as client:
+                return await coro_fn(client)
+        finally:
+            await server.close()
+
+    return asyncio.run(run())
+
+
+def test_parsed_body_shared_with_middleware():
+    """测试中间件和处理器拿到的是同一份解析结果"""
+    print("\n=== 测试 1: 请求体只解析一次 ===")
+
+    edge = FakeEdgeServer()
+    http_server = EdgeHTTPServer(edge, enable_cors=False)
+
+    seen = []
+
+    async def record_middleware(request):
+        seen.append(request['parsed'])
+        return None
+
+    http_server.add_middleware(record_middleware)
+
+    async def send(client):
+        return await client.send_request('POST', '/draft', {'type': 'draft_request', 'data': {'prompt': 'hi'}})
+
+    result = run_with_server(http_server, send)
+
+    assert result['data'] == {'echo': 'hi'}
+    assert 'latency_ms' in result
+    assert len(edge.received) == 1
+    assert seen[0] is edge.received[0]
+    assert http_server.get_metrics()['requests_total'] == 1
+
+    print("✅ 中间件与处理器共享解析结果")
+
+
+def test_get_route_without_body():
+    """测试无请求体的 GET 路由"""
+    print("\n=== 测试 2: GET 路由 ===")
+
+    http_server = EdgeHTTPServer(FakeEdgeServer(), enable_cors=False)
+
+    async def send(client):
+        return await client.health_check()
+
+    assert run_with_server(http_server, send) == {'status': 'healthy'}
+
+    print("✅ GET 路由正常")
+
+
+def test_cors_headers_on_registered_routes():
+    """测试 CORS 头覆盖构造之后才注册的路由，以及预检请求"""
+    print("\n=== 测试 3: CORS ===")
+
+    http_server = EdgeHTTPServer(FakeEdgeServer())
+
+    async def send(client):
+        async with client.session.get('/health') as resp:
+            get_origin = resp.headers.get('Access-Control-Allow-Origin')
+        async with client.session.options('/draft') as resp:
+            return get_origin, resp.status, resp.headers.get('Access-Control-Allow-Methods')
+
+    assert run_with_server(http_server, send) == ('*', 200, '*')
+
+    print("✅ CORS 头正确")
@@ -245,6 +245,44 @@ def test_statistics_summary():
     print("✅ 统计摘要功能测试通过\n")
 
 
+def test_recent_window():
+    """测试增量维护的近期窗口与逐条统计一致"""
+    print("\n" + "=" * 60)
+    print("测试4：HistoryTracker 近期窗口汇总")
+    print("=" * 60)
+    
+    tracker = HistoryTracker(max_history_size=50)
+    strategy = ExecutionStrategy.SPECULATIVE_STANDARD
+    
+    assert tracker.get_recent_window(strategy) == (0, 0.8, 100.0)
+    
+    for i in range(37):
+        tracker.add_record(ExecutionRecord(
+            timestamp=time.time() + i,
+            strategy=strategy,
+            acceptance_rate=(i % 7) / 10,
+            latency_ms=50.0 + i,
+            edge_latency_ms=20.0,
+            cloud_latency_ms=30.0 + i,
+            confidence_score=0.8,
+            success=True
+        ))
+    
+    window = tracker.get_recent_window(strategy, n=20)
+    assert window.count == 20
+    assert abs(window.mean_acceptance - tracker.get_recent_acceptance_rate(strategy, n=20)) < 1e-9
+    assert abs(window.mean_latency - tracker.get_avg_latency(strategy, n=20)) < 1e-9
+    
+    # 非默认窗口大小走逐条统计
+    assert tracker.get_recent_window(strategy, n=5).count == 5
+    
+    tracker.clear()
+    assert tracker.get_recent_window(strategy).count == 0
+    
+    print("✓ 窗口汇总与逐条统计一致")
+    print("✅ 近期窗口测试通过\n")
+
+
 def main():
     """运行所有测试"""
     print("\n" + "=" * 60)
@@ -256,6 +294,7 @@ def main():
         test_history_tracker()
         test_adaptive_calculator()
         test_statistics_summary()
+        test_recent_window()
         
         print("\n" + "=" * 60)
         print("✅ 所有核心模块测试通过！")